@@ -1,7 +1,15 @@
-from PIL import Image
 import numpy as np
 import torch
 
+from .resampling import cached_resize
+
+# Sélection de l'image d'une case (x, y) parmi N entrées : motif cyclique, périodique de N cases
+CYCLE_MODES = {
+    "checker": lambda x, y, n: (x + y) % n,
+    "rows": lambda x, y, n: y % n,
+    "columns": lambda x, y, n: x % n,
+}
+
 class CheckerboardNode:
     CATEGORY = "illusion"
     FUNCTION = "generate_checkerboard"
@@ -18,43 +26,60 @@ class CheckerboardNode:
                 "tile_width": ("INT", {"default": 128, "min": 8, "max": 1024}),   # Largeur carreau
                 "tile_height": ("INT", {"default": 128, "min": 8, "max": 1024}),  # Hauteur carreau
                 "tile_mode": (["crop", "resize"], {"default": "resize"}),
+            },
+            "optional": {
+                "img3": ("IMAGE", {"tooltip": "Optional third image, cycled with the others."}),
+                "img4": ("IMAGE", {"tooltip": "Optional fourth image, cycled with the others."}),
+                "cycle_mode": (list(CYCLE_MODES), {"default": "checker", "tooltip": "How the images alternate: checker ((x + y) mod N), rows or columns."}),
             }
         }
 
-    def generate_checkerboard(self, img1, img2, tiles_x, tiles_y, tile_width, tile_height, tile_mode):
-        # Conversion de torch.Tensor vers numpy si besoin
-        if hasattr(img1, "cpu"):
-            img1 = img1.cpu().numpy()
-        if hasattr(img2, "cpu"):
-            img2 = img2.cpu().numpy()
-        if isinstance(img1, list) or img1.ndim == 4:
-            img1 = img1[0]
-        if isinstance(img2, list) or img2.ndim == 4:
-            img2 = img2[0]
-        im1 = Image.fromarray(np.clip((img1 * 255), 0, 255).astype(np.uint8))
-        im2 = Image.fromarray(np.clip((img2 * 255), 0, 255).astype(np.uint8))
-
-        # Nouvelle taille finale
-        final_width = tiles_x * tile_width
-        final_height = tiles_y * tile_height
+    def prepare_tiles(self, image, tile_width, tile_height, tile_mode):
+        # Batch d'entrée -> dalles (B, tile_height, tile_width, 3) float32, sans passage par PIL
+        tiles = image if torch.is_tensor(image) else torch.as_tensor(np.asarray(image))
+        tiles = tiles.detach().cpu().float()
+        if tiles.ndim == 3:
+            tiles = tiles.unsqueeze(0)
+        if tiles.shape[-1] == 1:
+            tiles = tiles.expand(-1, -1, -1, 3)
+        tiles = tiles[..., :3]
 
-        # Préparer les dalles
         if tile_mode == "resize":
-            tile1 = im1.resize((tile_width, tile_height))
-            tile2 = im2.resize((tile_width, tile_height))
-        else:  # "crop"
-            tile1 = im1.crop((0, 0, tile_width, tile_height))
-            tile2 = im2.crop((0, 0, tile_width, tile_height))
+            # Bicubique, comme le redimensionnement PIL par défaut
+            return cached_resize(tiles, tile_width, tile_height, "bicubic").numpy()
 
-        result = Image.new("RGB", (final_width, final_height))
-        for y in range(tiles_y):
-            for x in range(tiles_x):
-                tile = tile1 if (x + y) % 2 == 0 else tile2
-                px, py = x * tile_width, y * tile_height
-                result.paste(tile, (px, py))
-        arr = np.array(result).astype(np.float32) / 255.0
-        tensor = torch.from_numpy(arr).unsqueeze(0)
-        return (tensor,)
+        # "crop" : coin haut gauche, complété en noir si l'image est plus petite que la dalle
+        out = np.zeros((tiles.shape[0], tile_height, tile_width, 3), dtype=np.float32)
+        h, w = min(tile_height, tiles.shape[1]), min(tile_width, tiles.shape[2])
+        out[:, :h, :w] = np.clip(tiles[:, :h, :w].numpy(), 0.0, 1.0)
+        return out
+
+    def generate_checkerboard(self, img1, img2, tiles_x, tiles_y, tile_width, tile_height, tile_mode,
+                              img3=None, img4=None, cycle_mode="checker"):
+        images = [img for img in (img1, img2, img3, img4) if img is not None]
+        tiles = [self.prepare_tiles(img, tile_width, tile_height, tile_mode) for img in images]
+        # Une image de sortie par image du plus grand batch, les batchs plus courts sont répétés
+        frame_count = max(len(t) for t in tiles)
+
+        # Motif périodique de n x n cases au plus : chaque classe de cases (y % py, x % px) reçoit la dalle
+        # de son image par une affectation par tranches, directement dans la sortie vue en
+        # (B, tiles_y, tile_height, tiles_x, tile_width, 3). Aucune copie intermédiaire des dalles.
+        n = len(images)
+        period_x, period_y = min(n, tiles_x), min(n, tiles_y)
+        x, y = np.arange(period_x)[np.newaxis, :], np.arange(period_y)[:, np.newaxis]
+        select = np.broadcast_to(CYCLE_MODES[cycle_mode](x, y, n), (period_y, period_x))
+
+        final_width = tiles_x * tile_width
+        final_height = tiles_y * tile_height
+        out = np.empty((frame_count, final_height, final_width, 3), dtype=np.float32)
+        cells = out.reshape(frame_count, tiles_y, tile_height, tiles_x, tile_width, 3)
+        for j in range(period_y):
+            for i in range(period_x):
+                source = tiles[select[j, i]]
+                # Image b du batch source -> images de sortie b, b + len(source), ...
+                for b in range(len(source)):
+                    cells[b::len(source), j::period_y, :, i::period_x] = source[b][:, np.newaxis]
+        return (torch.from_numpy(out),)
 
 NODE_CLASS_MAPPINGS = {
     "CheckerboardNode": CheckerboardNode,
@@ -1,6 +1,9 @@
 from PIL import Image
 import numpy as np
-import torch
+import math
+
+from .render_cache import cached_tensor, params_key
+from .sdf_shapes import polar_grid
 
 def parse_color(color):
     # Gère hex, noms, tuple/list
@@ -21,6 +24,49 @@ def parse_color(color):
     else:
         return (0, 0, 0)
 
+# Moteur de dégradés : le champ scalaire t (float32, [0,1]) est calculé une fois, puis converti en
+# couleurs par une table de correspondance 1D (LUT) et une seule indexation écrite dans la sortie.
+# Le coût ne dépend pas du nombre de couleurs du dégradé.
+LUT_SIZE = 4096
+
+
+def parse_stops(color1, color2, extra_colors=""):
+    # Couleurs du dégradé : color1, couleurs intermédiaires (séparées par des virgules), color2
+    extra = [c.strip() for c in (extra_colors or "").split(",") if c.strip()]
+    return [parse_color(c) for c in [color1] + extra + [color2]]
+
+
+def gradient_lut(stops, size=LUT_SIZE):
+    # Table (size, 3) float32 [0,1] : couleurs régulièrement espacées, interpolées linéairement.
+    # Même arrondi que l'ancien tracé (troncature en 8 bits).
+    stops = np.asarray(stops, dtype=np.float64)
+    samples = np.linspace(0.0, 1.0, size)
+    positions = np.linspace(0.0, 1.0, len(stops))
+    lut = np.empty((size, 3), dtype=np.float32)
+    for i in range(3):
+        lut[:, i] = np.floor(np.interp(samples, positions, stops[:, i]))
+    lut /= np.float32(255.0)
+    return lut
+
+
+def apply_lut(t, lut, out):
+    # t (H, W) float32 est quantifié en place en indices de la LUT, puis une seule indexation
+    # remplit out (H, W, 3).
+    np.clip(t, 0.0, 1.0, out=t)
+    t *= np.float32(len(lut) - 1)
+    np.rint(t, out=t)
+    np.take(lut, t.astype(np.intp), axis=0, out=out)
+    return out
+
+
+def normalize(t, t_min, t_max):
+    # Ramène t dans [0,1] en place (champ constant -> 0)
+    t -= np.float32(t_min)
+    if t_max > t_min:
+        t *= np.float32(1.0 / (t_max - t_min))
+    return t
+
+
 class ColorImageNode:
     CATEGORY = "illusion"
     FUNCTION = "generate_color"
@@ -36,65 +82,75 @@ class ColorImageNode:
                 "color1": ("STRING", {"default": "#ffffff"}),
                 "color2": ("STRING", {"default": "#000000"}),
                 "angle": ("FLOAT", {"default": 0.0, "min": 0, "max": 360, "step": 0.1}),
+            },
+            "optional": {
+                "extra_colors": ("STRING", {"default": "", "tooltip": "Intermediate gradient stops between color1 and color2, comma-separated, evenly spaced."}),
             }
         }
 
-    def generate_color(self, width, height, mode, color1, color2, angle):
-        rgb1 = parse_color(color1)
-        rgb2 = parse_color(color2)
-        arr = np.zeros((height, width, 3), dtype=np.uint8)
+    @classmethod
+    def IS_CHANGED(cls, **kwargs):
+        # Nœud pur : la sortie ne change qu'avec les paramètres
+        return params_key(cls.__name__, kwargs)
+
+    def gradient_field(self, width, height, mode, angle):
+        # Champ t (H, W) float32 dans [0,1], calculé à partir de coordonnées diffusables (1, W) et (H, 1)
         cx, cy = width // 2, height // 2
-        Y, X = np.ogrid[:height, :width]
+        X = np.arange(width, dtype=np.float32)[np.newaxis, :]
+        Y = np.arange(height, dtype=np.float32)[:, np.newaxis]
+
+        if mode in ("linear", "mirror"):
+            theta = np.deg2rad(angle)
+            x = np.linspace(0, 1, width, dtype=np.float32)[np.newaxis, :] * np.float32(np.cos(theta))
+            y = np.linspace(0, 1, height, dtype=np.float32)[:, np.newaxis] * np.float32(np.sin(theta))
+            t = x + y
+            if mode == "linear":
+                # Champ séparable : extrema aux coins
+                return normalize(t, x.min() + y.min(), x.max() + y.max())
+            t -= np.float32(0.5)
+            t = np.abs(t, out=t)
+            t *= np.float32(2.0) # miroir autour du centre
+            return normalize(t, t.min(), t.max())
+
+        if mode == "radial":
+            # Rayon partagé (cache, lecture seule) : copie normalisée, maximum atteint au coin le plus éloigné
+            rho, _ = polar_grid(width, cx, cy, (0, height, 0, width))
+            return normalize(rho.copy(), 0.0, math.hypot(max(cx, width - 1 - cx), max(cy, height - 1 - cy)))
+
+        if mode == "angular":  # Sweep/angle Photoshop
+            # Angle et repli en float64, comme l'ancien calcul : en float32, l'arrondi près de la couture
+            # (theta + pi + offset = 2π) fait basculer des colonnes entières de couleur1 à couleur2
+            theta = np.arctan2(np.arange(height, dtype=np.float64)[:, np.newaxis] - cy,
+                               np.arange(width, dtype=np.float64)[np.newaxis, :] - cx)  # -π à π
+            theta += np.pi + np.deg2rad(angle)
+            np.mod(theta, 2 * np.pi, out=theta)
+            theta /= 2 * np.pi
+            return theta.astype(np.float32)
+
+        if mode == "diamond":
+            dx = np.abs((X - np.float32(cx)) / np.float32(width / 2))
+            dy = np.abs((Y - np.float32(cy)) / np.float32(height / 2))
+            t = dx + dy
+            t *= np.float32(0.5)
+            return t
+
+        return np.zeros((height, width), dtype=np.float32)
+
+    def generate_color(self, width, height, mode, color1, color2, angle, extra_colors=""):
+        params = dict(width=width, height=height, mode=mode, color1=color1, color2=color2, angle=angle,
+                      extra_colors=extra_colors)
+        return (cached_tensor("ColorImageNode", params, lambda: self.render_color(**params)),)
+
+    def render_color(self, width, height, mode, color1, color2, angle, extra_colors=""):
+        out = np.empty((1, height, width, 3), dtype=np.float32)
 
         if mode == "solid":
-            arr[:, :] = rgb1
+            out[...] = np.asarray(parse_color(color1), dtype=np.float32) / np.float32(255.0)
+        else:
+            lut = gradient_lut(parse_stops(color1, color2, extra_colors))
+            apply_lut(self.gradient_field(width, height, mode, angle), lut, out[0])
 
-        elif mode == "linear":
-            x = np.linspace(0, 1, width)
-            y = np.linspace(0, 1, height)
-            Xg, Yg = np.meshgrid(x, y)
-            theta = np.deg2rad(angle)
-            t = Xg * np.cos(theta) + Yg * np.sin(theta)
-            t = (t - t.min()) / (t.max() - t.min())
-            for i in range(3):
-                arr[..., i] = (rgb1[i] * (1 - t) + rgb2[i] * t).astype(np.uint8)
-
-        elif mode == "radial":
-            dist = np.sqrt((X - cx) ** 2 + (Y - cy) ** 2)
-            dist = dist / dist.max()
-            for i in range(3):
-                arr[..., i] = (rgb1[i] * (1 - dist) + rgb2[i] * dist).astype(np.uint8)
-
-        elif mode == "angular":  # Sweep/angle Photoshop
-            Xg = X - cx
-            Yg = Y - cy
-            theta = np.arctan2(Yg, Xg)  # -π à π
-            offset = np.deg2rad(angle)
-            t = ((theta + np.pi + offset) % (2 * np.pi)) / (2 * np.pi)
-            for i in range(3):
-                arr[..., i] = (rgb1[i] * (1 - t) + rgb2[i] * t).astype(np.uint8)
-
-        elif mode == "mirror":  # Réfléchi
-            x = np.linspace(0, 1, width)
-            y = np.linspace(0, 1, height)
-            Xg, Yg = np.meshgrid(x, y)
-            theta = np.deg2rad(angle)
-            t = Xg * np.cos(theta) + Yg * np.sin(theta)
-            t = np.abs((t - 0.5) * 2)  # miroir autour du centre
-            t = (t - t.min()) / (t.max() - t.min())
-            for i in range(3):
-                arr[..., i] = (rgb1[i] * (1 - t) + rgb2[i] * t).astype(np.uint8)
-
-        elif mode == "diamond":
-            dx = np.abs((X - cx) / (width / 2))
-            dy = np.abs((Y - cy) / (height / 2))
-            t = (dx + dy) / 2
-            t = np.clip(t, 0, 1)
-            for i in range(3):
-                arr[..., i] = (rgb1[i] * (1 - t) + rgb2[i] * t).astype(np.uint8)
-
-        img = torch.from_numpy(arr.astype(np.float32) / 255.0).unsqueeze(0)
-        return (img,)
+        return out
 
 NODE_CLASS_MAPPINGS = {
     "ColorImageNode": ColorImageNode,
@@ -1,8 +1,20 @@
-from PIL import Image, ImageDraw
+from PIL import ImageColor
 import numpy as np
-import torch
 import math
 
+from .batch_utils import loop_phases
+from .periodic_tiling import translated_frame
+from .render_cache import COVERAGE_CACHE, cached_tensor, params_key
+from .sdf_shapes import (
+    cached_frame_ink, centered_stroke, concentric_field, coverage, hex_lattice_distance, phased_level_distance,
+    pixel_grid, polar_grid, polygon_norm, rays_distance, rays_field, render_frames, render_mask,
+    sine_band_distance, sine_family_distance, sine_samples, window_bounds,
+)
+
+# Motifs dont l'animation est une translation : les images sont des tranches de couches rendues une
+# fois à la phase 0 (voir geometric_motion)
+TRANSLATED_PATTERNS = ("wavy_grid", "hexagons", "waves")
+
 class OpticalGeometricNode:
     CATEGORY = "illusion"
     FUNCTION = "generate_geometric"
@@ -16,85 +28,237 @@ class OpticalGeometricNode:
                     ["concentric_squares", "concentric_triangles", "wavy_grid", "starburst", "hexagons", "waves"],
                     {"default": "concentric_squares"}
                 ),
-                "size": ("INT", {"default": 512, "min": 128, "max": 2048}),
+                "size": ("INT", {"default": 512, "min": 128, "max": 4096}),
                 "frequency": ("INT", {"default": 10, "min": 2, "max": 100}),
                 "line_width": ("INT", {"default": 3, "min": 1, "max": 50}),
                 "color1": ("STRING", {"default": "#FFFFFF"}),
                 "color2": ("STRING", {"default": "#000000"})
+            },
+            "optional": {
+                "antialias": ("BOOLEAN", {"default": False, "tooltip": "Smooth edges using analytic pixel coverage."}),
+                "frame_count": ("INT", {"default": 1, "min": 1, "max": 1024, "tooltip": "Number of frames of a seamless animation loop (one batch)."}),
+                "phase": ("FLOAT", {"default": 0.0, "min": 0.0, "max": 1.0, "step": 0.01, "tooltip": "Animation phase of the first frame (0-1, one full loop)."}),
             }
         }
 
-    def generate_geometric(self, pattern_type, size, frequency, line_width, color1, color2):
-        img = Image.new('RGB', (size, size), color1)
-        draw = ImageDraw.Draw(img)
+    @classmethod
+    def IS_CHANGED(cls, **kwargs):
+        # Nœud pur : la sortie ne change qu'avec les paramètres
+        return params_key(cls.__name__, kwargs)
+
+    def hex_layout(self, size, frequency):
+        # Réseau de centres du nid d'abeille : même disposition que l'ancien tracé polygone par polygone
+        hex_r = max(1, size // (2 * frequency))
+        step_y = max(1, int(hex_r * 1.5))
+        step_x = max(1, int(hex_r * math.sqrt(3)))
+        centers_y = np.arange(-hex_r, size + hex_r, step_y)
+        row_shifts = [hex_r * math.sqrt(3) / 2 if (y // (hex_r * 1.5)) % 2 else 0 for y in centers_y]
+        return hex_r, step_y, step_x, centers_y, row_shifts
+
+    def geometric_period(self, pattern_type, size, frequency, line_width):
+        # Période fondamentale (py, px) et marges (haut, bas, gauche, droite) non périodiques,
+        # ou None si le motif n'est pas périodique. Voir periodic_tiling.render_periodic.
+        if pattern_type == "hexagons":
+            hex_r, step_y, step_x, _, row_shifts = self.hex_layout(size, frequency)
+            # Périodique seulement si le décalage des lignes alterne strictement (1.5 * r entier)
+            if any(row_shifts[i] != row_shifts[i % 2] for i in range(len(row_shifts))):
+                return None
+            margin = 2 * (step_y + hex_r) # lignes de centres tronquées en haut et en bas
+            return (2 * step_y, step_x), (margin, margin, 0, 0)
+        if pattern_type == "wavy_grid":
+            if size % frequency:
+                return None
+            spacing = size // frequency
+            # Courbes manquantes au-delà des bords : bande d'une amplitude plus le trait
+            margin = int(math.ceil(size / 30 + line_width / 2.0)) + 2
+            return (spacing, spacing), (margin, margin, margin, margin)
+        return None
+
+    def wavy_grid_layout(self, size, frequency, line_width):
+        # Courbes du quadrillage ondulé : positions, amplitude, nombre d'onde, demi-largeur du trait
+        offset, half_width = centered_stroke(line_width)
+        offsets = np.arange(0, size, size // frequency) + offset
+        return offsets, size / 30, 2 * math.pi * frequency / size, half_width
+
+    def geometric_fields(self, pattern_type, size, frequency, line_width, window=None):
+        # Champs indépendants de la phase (coordonnées de niveau, rayon, angle) : calculés une fois par
+        # fenêtre et partagés par toutes les images d'une animation. Chaque image ne refait que
+        # l'arrondi de la coordonnée de niveau décalée, la distance et la couverture.
         cx, cy = size // 2, size // 2
+        if pattern_type == "concentric_squares":
+            # Rectangles [o, o, size - o, size - o] : bord à size/2 - o en distance de Chebyshev
+            dx, dy = pixel_grid(size, size / 2, size / 2, window)
+            step = size // (2 * frequency)
+            level, half_width = concentric_field(
+                np.maximum(np.abs(dx), np.abs(dy)), size / 2 - step * np.arange(frequency), line_width
+            )
+            return {"level": level, "half_width": half_width}
+        if pattern_type == "concentric_triangles":
+            # Triangles équilatéraux pointe en haut, de rayon r : apothème r / 2
+            dx, dy = pixel_grid(size, cx, cy, window)
+            edges = 0.5 * (size // 2) * np.arange(1, frequency + 1) / frequency
+            level, half_width = concentric_field(polygon_norm(dx, dy, 3, math.pi / 2), edges, line_width)
+            return {"level": level, "half_width": half_width}
+        if pattern_type in ("wavy_grid", "waves"):
+            dx, dy = pixel_grid(size, 0, 0, window)
+            return {"dx": dx, "dy": dy}
+        if pattern_type == "starburst":
+            rho, phi = polar_grid(size, cx, cy, window)
+            dx, dy = pixel_grid(size, cx, cy, window)
+            return {"rays": rays_field(dx, dy, rho, phi, frequency * 2, size // 2)}
+        return {}
+
+    def wave_bands(self, size, frequency, line_width, antialias=False, window=None, phase=0.0, fields=None):
+        # Vagues sinusoïdales (motif Op Art simple), chacune seulement sur la bande de lignes qu'elle
+        # touche : liste (vague, b0, b1, couverture de la bande) relative à la fenêtre. Les échantillons
+        # de toutes les vagues sont calculés d'un coup, (frequency, 1, W).
+        y0, y1, _, _ = window_bounds(size, window)
+        if fields is None:
+            fields = self.geometric_fields("waves", size, frequency, line_width, window)
+        offset, half_width = centered_stroke(line_width)
+        dx, dy = fields["dx"], fields["dy"]
+        amps = size / (30 + np.arange(frequency) * 5)
+        waves, gradients = sine_samples(
+            dx, amps, 2 * math.pi * np.arange(1, frequency + 1) / size, 2 * math.pi * phase
+        )
+        bands = []
+        for i in range(frequency):
+            amp = amps[i]
+            y_offset = i * size // (frequency + 1) + offset
+            b0 = max(y0, int(math.floor(y_offset - amp - half_width - 1))) - y0
+            b1 = min(y1, int(math.ceil(y_offset + amp + half_width + 2))) - y0
+            if b0 >= b1:
+                continue
+            _, distance = sine_band_distance(dy[b0:b1], [y_offset], waves[i], gradients[i])
+            bands.append((i, b0, b1, coverage(distance, half_width, antialias)))
+        return bands
+
+    def geometric_coverage(self, pattern_type, size, frequency, line_width, antialias=False, window=None,
+                           phase=0.0, fields=None):
+        # Masque d'encre (color2), float32 [0,1], sur la fenêtre (y0, y1, x0, x1) ou toute la toile.
+        # Pour les motifs alternés, le contour le plus proche décide : pair -> color2, impair -> color1.
+        # phase (0-1) fait défiler le motif d'une période ; phase = 0 donne l'image fixe.
+        y0, y1, x0, x1 = window_bounds(size, window)
+        if fields is None:
+            fields = self.geometric_fields(pattern_type, size, frequency, line_width, window)
 
         if pattern_type == "concentric_squares":
+            # En animation, les carrés entrent par le bord et se resserrent vers le centre
             step = size // (2 * frequency)
-            for i in range(frequency):
-                offset = step * i
-                draw.rectangle(
-                    [offset, offset, size - offset, size - offset],
-                    outline=color2 if i % 2 == 0 else color1, width=line_width
-                )
-
-        elif pattern_type == "concentric_triangles":
-            for i in range(frequency):
-                r = (size // 2) * (i + 1) / frequency
-                points = [
-                    (cx, cy - r),
-                    (cx - r * math.sin(math.pi / 3), cy + r * 0.5),
-                    (cx + r * math.sin(math.pi / 3), cy + r * 0.5)
-                ]
-                draw.polygon(points, outline=color2 if i % 2 == 0 else color1, width=line_width)
-
-        elif pattern_type == "wavy_grid":
-            waves = frequency
-            amp = size / 30
-            for y in range(0, size, size // waves):
-                points = [
-                    (x, int(y + amp * math.sin(2 * math.pi * x / size * waves)))
-                    for x in range(size)
-                ]
-                draw.line(points, fill=color2, width=line_width)
-            for x in range(0, size, size // waves):
-                points = [
-                    (int(x + amp * math.sin(2 * math.pi * y / size * waves)), y)
-                    for y in range(size)
-                ]
-                draw.line(points, fill=color2, width=line_width)
-
-        elif pattern_type == "starburst":
-            rays = frequency * 2
-            for i in range(rays):
-                angle = 2 * math.pi * i / rays
-                x = cx + (size // 2) * math.cos(angle)
-                y = cy + (size // 2) * math.sin(angle)
-                draw.line([(cx, cy), (x, y)], fill=color2 if i % 2 == 0 else color1, width=line_width)
-
-        elif pattern_type == "hexagons":
-            # motif nid d’abeille
-            hex_r = size // (2 * frequency)
-            for y in range(-hex_r, size + hex_r, int(hex_r * 1.5)):
-                for x in range(-hex_r, size + hex_r, int(hex_r * math.sqrt(3))):
-                    x_shift = x + (hex_r * math.sqrt(3)/2 if (y // (hex_r * 1.5)) % 2 else 0)
-                    points = [
-                        (x_shift + hex_r * math.cos(a), y + hex_r * math.sin(a))
-                        for a in [math.radians(60 * k) for k in range(6)]
-                    ]
-                    draw.polygon(points, outline=color2, width=line_width)
-
-        elif pattern_type == "waves":
-            # Superposition de vagues sinusoïdales (motif Op Art simple)
-            for i in range(frequency):
-                amp = size / (30 + i * 5)
-                y_offset = i * size // (frequency + 1)
-                points = [
-                    (x, int(y_offset + amp * math.sin(2 * math.pi * x / size * (i+1))))
-                    for x in range(size)
-                ]
-                draw.line(points, fill=color2 if i % 2 == 0 else color1, width=line_width)
-
-        img_array = np.array(img).astype(np.float32) / 255.0
-        tensor = torch.from_numpy(img_array).unsqueeze(0)
-        return (tensor,)
+            even, distance = phased_level_distance(
+                fields["level"], size / 2 - step * np.arange(frequency), phase, (0, size / 2)
+            )
+            return coverage(distance, fields["half_width"], antialias) * even
+
+        if pattern_type == "concentric_triangles":
+            edges = 0.5 * (size // 2) * np.arange(1, frequency + 1) / frequency
+            even, distance = phased_level_distance(fields["level"], edges, phase, (0, edges[-1]))
+            return coverage(distance, fields["half_width"], antialias) * even
+
+        if pattern_type == "wavy_grid":
+            offsets, amp, wavenumber, half_width = self.wavy_grid_layout(size, frequency, line_width)
+            dx, dy = fields["dx"], fields["dy"]
+            _, d_rows = sine_family_distance(dx, dy, offsets, amp, wavenumber, 2 * math.pi * phase)
+            _, d_cols = sine_family_distance(dy, dx, offsets, amp, wavenumber, 2 * math.pi * phase)
+            return coverage(np.minimum(d_rows, d_cols), half_width, antialias)
+
+        if pattern_type == "starburst":
+            # Une période = deux secteurs (un rayon de chaque couleur)
+            even, distance = rays_distance(fields["rays"], 2 * math.pi * phase / frequency)
+            return coverage(distance, line_width / 2.0, antialias) * even
+
+        if pattern_type == "hexagons":
+            # motif nid d’abeille, translaté horizontalement d'une colonne par période
+            hex_r, _, step_x, centers_y, row_shifts = self.hex_layout(size, frequency)
+            distance, half_width = hex_lattice_distance(
+                size, centers_y, np.asarray(row_shifts) + phase * step_x, -hex_r, step_x, hex_r, line_width, window
+            )
+            return coverage(distance, half_width, antialias)
+
+        if pattern_type == "waves":
+            # Les vagues se croisent : on les compose dans l'ordre de tracé
+            ink = np.zeros((y1 - y0, x1 - x0), dtype=np.float32)
+            for i, b0, b1, band in self.wave_bands(size, frequency, line_width, antialias, window, phase, fields):
+                ink[b0:b1] += (float(i % 2 == 0) - ink[b0:b1]) * band
+            return ink
+
+        return np.zeros((y1 - y0, x1 - x0), dtype=np.float32)
+
+    def geometric_motion(self, pattern_type, size, frequency, line_width, antialias=False):
+        # Couches des motifs de TRANSLATED_PATTERNS pour periodic_tiling.translated_frame : la phase ne
+        # fait que translater chaque couche, qui est rendue une fois à la phase 0 sur une étendue élargie
+        # d'une période. Retourne (couches, composition). L'animation avance par pixels entiers.
+        if pattern_type == "hexagons":
+            # Le réseau défile vers la droite d'une colonne (step_x, entier) par boucle ; il est
+            # périodique en x, l'élargissement à gauche est donc sa première colonne
+            _, _, step_x, _, _ = self.hex_layout(size, frequency)
+            ink = self.render_ink(pattern_type, size, frequency, line_width, antialias)
+            mask = np.concatenate([ink[:, :step_x], ink], axis=1)
+            return [dict(mask=mask, axis=1, period=step_x, reverse=True, rows=None, value=1.0)], "over"
+
+        if pattern_type == "wavy_grid":
+            # sin(k * x + 2pi * phase) : les lignes ondulées défilent le long de x, les colonnes le long
+            # de y, d'une longueur d'onde par boucle
+            offsets, amp, wavenumber, half_width = self.wavy_grid_layout(size, frequency, line_width)
+            extra = int(math.ceil(size / frequency))
+            dx, dy = pixel_grid(size, 0, 0, (0, size, 0, size + extra))
+            _, d_rows = sine_family_distance(dx, dy, offsets, amp, wavenumber)
+            dx, dy = pixel_grid(size, 0, 0, (0, size + extra, 0, size))
+            _, d_cols = sine_family_distance(dy, dx, offsets, amp, wavenumber)
+            layers = [
+                dict(mask=coverage(d_rows, half_width, antialias), axis=1, period=size / frequency, reverse=False,
+                     rows=None, value=1.0),
+                dict(mask=coverage(d_cols, half_width, antialias), axis=0, period=size / frequency, reverse=False,
+                     rows=None, value=1.0),
+            ]
+            return layers, "max"
+
+        if pattern_type == "waves":
+            # La vague i (longueur d'onde size / (i + 1)) défile le long de x d'une longueur d'onde par
+            # boucle : toutes les bandes sont rendues sur une largeur élargie de la plus grande
+            bands = self.wave_bands(size, frequency, line_width, antialias, (0, size, 0, 2 * size))
+            layers = [
+                dict(mask=band, axis=1, period=size / (i + 1), reverse=False, rows=(b0, b1), value=float(i % 2 == 0))
+                for i, b0, b1, band in bands
+            ]
+            return layers, "over"
+        return None
+
+    def render_ink(self, pattern_type, size, frequency, line_width, antialias=False, phase=0.0, field_cache=None):
+        # Masque de couverture (size, size) d'une image, voir sdf_shapes.render_mask
+        return render_mask(
+            size,
+            lambda window: self.geometric_fields(pattern_type, size, frequency, line_width, window),
+            lambda window, fields: self.geometric_coverage(
+                pattern_type, size, frequency, line_width, antialias, window, phase, fields
+            ),
+            self.geometric_period(pattern_type, size, frequency, line_width),
+            field_cache,
+        )
+
+    def generate_geometric(self, pattern_type, size, frequency, line_width, color1, color2, antialias=False,
+                           frame_count=1, phase=0.0):
+        params = dict(pattern_type=pattern_type, size=size, frequency=frequency, line_width=line_width, color1=color1,
+                      color2=color2, antialias=antialias, frame_count=frame_count, phase=phase)
+        return (cached_tensor("OpticalGeometricNode", params, lambda: self.render_geometric(**params)),)
+
+    def render_geometric(self, pattern_type, size, frequency, line_width, color1, color2, antialias=False,
+                         frame_count=1, phase=0.0):
+        rgb1, rgb2 = ImageColor.getrgb(color1), ImageColor.getrgb(color2)
+        phases = loop_phases(phase, frame_count)
+        geometry = (pattern_type, size, frequency, line_width, bool(antialias))
+
+        if len(phases) > 1 and pattern_type in TRANSLATED_PATTERNS:
+            # Couches à la phase 0 en cache, chaque image n'en est qu'une tranche
+            layers, combine = COVERAGE_CACHE.get_or_create(
+                ("geometric-motion",) + geometry, lambda: self.geometric_motion(*geometry)
+            )
+
+            def frame_ink(i):
+                return translated_frame(layers, phases[i], size, size, combine)
+        else:
+            field_cache = {}
+            frame_ink = cached_frame_ink(("geometric",) + geometry, phases, lambda frame_phase: self.render_ink(
+                pattern_type, size, frequency, line_width, antialias, frame_phase, field_cache
+            ))
+        return render_frames(size, len(phases), frame_ink, rgb1, rgb2)
@@ -1,7 +1,13 @@
-from PIL import Image, ImageDraw
+from PIL import ImageColor
 import numpy as np
-import torch
-import math
+
+from .batch_utils import loop_phases
+from .render_cache import cached_tensor, params_key
+from .sdf_shapes import (
+    cached_frame_ink, centered_stroke, concentric_field, coverage, nearest_level, phased_level_distance,
+    phased_levels, pixel_grid, polar_grid, render_frames, render_mask, spiral_distance, spiral_field,
+    window_bounds,
+)
 
 class OpticalIllusionNode:
     CATEGORY = "illusion"
@@ -13,54 +19,131 @@ class OpticalIllusionNode:
         return {
             "required": {
                 "illusion_type": (["checkerboard", "circles", "lines", "spiral"], {"default": "checkerboard"}),
-                "size": ("INT", {"default": 512, "min": 128, "max": 2048}),
+                "size": ("INT", {"default": 512, "min": 128, "max": 4096}),
                 "frequency": ("INT", {"default": 10, "min": 2, "max": 100}),
                 "line_width": ("INT", {"default": 3, "min": 1, "max": 100}),
                 "color1": ("STRING", {"default": "#FFFFFF"}),
                 "color2": ("STRING", {"default": "#000000"})
+            },
+            "optional": {
+                "antialias": ("BOOLEAN", {"default": False, "tooltip": "Smooth edges using analytic pixel coverage."}),
+                "frame_count": ("INT", {"default": 1, "min": 1, "max": 1024, "tooltip": "Number of frames of a seamless animation loop (one batch)."}),
+                "phase": ("FLOAT", {"default": 0.0, "min": 0.0, "max": 1.0, "step": 0.01, "tooltip": "Animation phase of the first frame (0-1, one full loop)."}),
             }
         }
 
-    def generate_illusion(self, illusion_type, size, frequency, line_width, color1, color2):
-        img = Image.new('RGB', (size, size), color1)
-        draw = ImageDraw.Draw(img)
+    @classmethod
+    def IS_CHANGED(cls, **kwargs):
+        # Nœud pur : la sortie ne change qu'avec les paramètres
+        return params_key(cls.__name__, kwargs)
 
+    def illusion_period(self, illusion_type, size, frequency, line_width):
+        # Période fondamentale (py, px) et marges (haut, bas, gauche, droite) non périodiques,
+        # ou None si le motif n'est pas périodique. Voir periodic_tiling.render_periodic.
         if illusion_type == "checkerboard":
+            # La première ligne/colonne n'a pas de bord de case précédente, et tout ce qui suit la
+            # dernière case est hors motif : ces bandes sont recalculées
             tile = size // frequency
-            for y in range(frequency):
-                for x in range(frequency):
-                    if (x + y) % 2 == 0:
-                        draw.rectangle([x*tile, y*tile, (x+1)*tile, (y+1)*tile], fill=color2)
+            tail = size - frequency * tile
+            return (2 * tile, 2 * tile), (1, tail, 1, tail)
+        if illusion_type == "lines":
+            return (1, size), (0, 0, 0, 0) # toutes les lignes de pixels sont identiques
+        return None
 
-        elif illusion_type == "circles":
+    def illusion_fields(self, illusion_type, size, frequency, line_width, window=None):
+        # Champs indépendants de la phase (coordonnées de niveau ou de tour, coordonnées) : calculés une
+        # fois par fenêtre et partagés par toutes les images d'une animation. Chaque image ne refait que
+        # l'arrondi de la coordonnée décalée, la distance et la couverture.
+        cx, cy = size // 2, size // 2
+        if illusion_type == "circles":
+            rho, _ = polar_grid(size, cx, cy, window)
             step = size / (frequency * 2)
-            for i in range(frequency):
-                radius = step * (i + 1)
-                bbox = [size//2 - radius, size//2 - radius, size//2 + radius, size//2 + radius]
-                draw.ellipse(bbox, outline=color2 if i % 2 == 0 else color1, width=line_width)
+            level, half_width = concentric_field(rho, step * np.arange(1, frequency + 1), line_width)
+            return {"level": level, "half_width": half_width}
+        if illusion_type == "lines":
+            dx, _ = pixel_grid(size, 0, 0, window)
+            return {"dx": dx}
+        if illusion_type == "spiral":
+            rho, phi = polar_grid(size, cx, cy, window)
+            return {"spiral": spiral_field(rho, phi, frequency, size * 0.48, line_width)}
+        return {}
+
+    def illusion_coverage(self, illusion_type, size, frequency, line_width, antialias=False, window=None,
+                          phase=0.0, fields=None):
+        # Masque d'encre (color2), float32 [0,1], sur la fenêtre (y0, y1, x0, x1) ou toute la toile.
+        # Pour les motifs alternés, le contour le plus proche décide : pair -> color2, impair -> color1.
+        # phase (0-1) fait défiler le motif d'une période ; phase = 0 donne l'image fixe.
+        y0, y1, x0, x1 = window_bounds(size, window)
+        if fields is None:
+            fields = self.illusion_fields(illusion_type, size, frequency, line_width, window)
+
+        if illusion_type == "checkerboard":
+            # Les rectangles de draw.rectangle incluent leurs deux bords : un pixel sur une frontière
+            # de case touche aussi la case précédente. La phase fait défiler les colonnes dans le damier.
+            tile = size // frequency
+            end = frequency * tile
+            shift = int(round(phase * 2 * tile)) % (2 * tile)
+
+            def axis_candidates(coords, shift=0):
+                cell = (coords - shift) // tile
+                on_edge = ((coords - shift) % tile == 0) & (coords > 0)
+                return [(cell, coords < end), (cell - 1, on_edge & (coords <= end))]
+
+            ink = np.zeros((y1 - y0, x1 - x0), dtype=bool)
+            for cell_x, valid_x in axis_candidates(np.arange(x0, x1), shift):
+                for cell_y, valid_y in axis_candidates(np.arange(y0, y1)):
+                    ink |= (valid_y[:, np.newaxis] & valid_x[np.newaxis, :]
+                            & ((cell_y[:, np.newaxis] + cell_x[np.newaxis, :]) % 2 == 0))
+            return ink.astype(np.float32)
 
-        elif illusion_type == "lines":
+        if illusion_type == "circles":
+            # Les anneaux naissent au centre et s'étendent jusqu'au dernier rayon
+            step = size / (frequency * 2)
+            even, distance = phased_level_distance(
+                fields["level"], step * np.arange(1, frequency + 1), phase, (0, step * frequency)
+            )
+            return coverage(distance, fields["half_width"], antialias) * even
+
+        if illusion_type == "lines":
             spacing = size / frequency
-            for i in range(frequency):
-                offset = i * spacing
-                draw.line([(offset, 0), (offset, size)], fill=color2 if i % 2 == 0 else color1, width=line_width)
-
-        elif illusion_type == "spiral":
-            cx, cy = size // 2, size // 2
-            max_radius = size * 0.48
-            num_turns = frequency
-            step_theta = math.pi / 720  # très fin = très lisse
-            a = 0
-            b = max_radius / (2 * math.pi * num_turns)
-            theta = 0
-            while theta < 2 * math.pi * num_turns:
-                r = a + b * theta
-                bbox = [cx - r, cy - r, cx + r, cy + r]
-                start = math.degrees(theta)
-                end = math.degrees(theta + step_theta)
-                draw.arc(bbox, start, end, fill=color2, width=line_width)
-                theta += step_theta
-
-        img_array = np.array(img).astype(np.float32) / 255.0
-        tensor = torch.from_numpy(img_array).unsqueeze(0)
-        return (tensor,)
+            offset, half_width = centered_stroke(line_width)
+            levels = spacing * np.arange(frequency) + offset
+            levels, parity = phased_levels(levels, phase, (-np.inf, levels[-1]))
+            index, distance = nearest_level(fields["dx"], levels)
+            ink = coverage(distance, half_width, antialias) * (parity[index] % 2 == 0)
+            return np.ascontiguousarray(np.broadcast_to(ink, (y1 - y0, x1 - x0)))
+
+        if illusion_type == "spiral":
+            distance, half_width = spiral_distance(fields["spiral"], 2 * np.pi * phase)
+            return coverage(distance, half_width, antialias)
+
+        return np.zeros((y1 - y0, x1 - x0), dtype=np.float32)
+
+    def render_ink(self, illusion_type, size, frequency, line_width, antialias=False, phase=0.0, field_cache=None):
+        # Masque de couverture (size, size) d'une image, voir sdf_shapes.render_mask
+        return render_mask(
+            size,
+            lambda window: self.illusion_fields(illusion_type, size, frequency, line_width, window),
+            lambda window, fields: self.illusion_coverage(
+                illusion_type, size, frequency, line_width, antialias, window, phase, fields
+            ),
+            self.illusion_period(illusion_type, size, frequency, line_width),
+            field_cache,
+        )
+
+    def generate_illusion(self, illusion_type, size, frequency, line_width, color1, color2, antialias=False,
+                          frame_count=1, phase=0.0):
+        params = dict(illusion_type=illusion_type, size=size, frequency=frequency, line_width=line_width, color1=color1,
+                      color2=color2, antialias=antialias, frame_count=frame_count, phase=phase)
+        return (cached_tensor("OpticalIllusionNode", params, lambda: self.render_illusion(**params)),)
+
+    def render_illusion(self, illusion_type, size, frequency, line_width, color1, color2, antialias=False,
+                        frame_count=1, phase=0.0):
+        rgb1, rgb2 = ImageColor.getrgb(color1), ImageColor.getrgb(color2)
+        phases = loop_phases(phase, frame_count)
+        geometry = ("illusion", illusion_type, size, frequency, line_width, bool(antialias))
+        field_cache = {}
+        frame_ink = cached_frame_ink(geometry, phases, lambda frame_phase: self.render_ink(
+            illusion_type, size, frequency, line_width, antialias, frame_phase, field_cache
+        ))
+        return render_frames(size, len(phases), frame_ink, rgb1, rgb2)
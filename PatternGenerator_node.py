@@ -1,7 +1,37 @@
 import numpy as np
-import torch
 from PIL import Image, ImageDraw, ImageColor
-import random
+from functools import lru_cache
+
+from .batch_utils import map_frames, resolve_batch_seeds
+from .periodic_tiling import tile_to
+from .render_cache import cached_tensor, params_key
+
+DOT_STAMP_CHUNK = 1 << 22 # Nombre max. de pixels de tampon traités par passe (borne la mémoire)
+
+@lru_cache(maxsize=None)
+def disc_offsets(radius):
+    # Pixels couverts par draw.ellipse((x-r, y-r, x+r, y+r)) relativement au centre (x, y).
+    # Le disque est rasterisé une seule fois par PIL : les tampons sont donc identiques au tracé PIL.
+    size = 2 * radius + 1
+    disc = Image.new("L", (size, size), 0)
+    ImageDraw.Draw(disc).ellipse((0, 0, 2 * radius, 2 * radius), fill=255)
+    dy, dx = np.nonzero(np.array(disc))
+    return dy - radius, dx - radius
+
+def stamp_dots(height, width, dot_x, dot_y, dot_radius):
+    # Masque (H, W) bool des disques : regroupement par rayon, puis dispersion vectorisée des tampons.
+    mask = np.zeros(height * width, dtype=bool)
+    for radius in np.unique(dot_radius):
+        selected = dot_radius == radius
+        cx, cy = dot_x[selected], dot_y[selected]
+        off_y, off_x = disc_offsets(int(radius))
+        chunk = max(1, DOT_STAMP_CHUNK // off_y.size)
+        for start in range(0, cx.size, chunk):
+            ys = (cy[start:start + chunk, np.newaxis] + off_y).ravel()
+            xs = (cx[start:start + chunk, np.newaxis] + off_x).ravel()
+            inside = (ys >= 0) & (ys < height) & (xs >= 0) & (xs < width)
+            mask[(ys * width + xs)[inside]] = True
+    return mask.reshape(height, width)
 
 class PatternGeneratorNode:
     PATTERN_TYPES = ["Stripes", "Checkerboard", "Random Dots", "Solid Color", "Gradient", "Noise"]
@@ -18,6 +48,10 @@ class PatternGeneratorNode:
                 "parameter1": ("INT", {"default": 1, "min": 0, "max": 256, "step": 1, "tooltip":"Stripes:width; Dots:density%; Gradient:direction; Noise:0=Color/1=Grayscale"}), 
                 "parameter2": ("INT", {"default": 1, "min": 1, "max": 64, "step": 1, "tooltip":"Dots:max_radius; Noise:block_scale"}),
                 "seed": ("INT", {"default": 0, "min": 0, "max": 0xFFFFFFFF}), 
+            },
+            "optional": {
+                "batch_count": ("INT", {"default": 1, "min": 1, "max": 4096, "step": 1, "tooltip": "Number of frames, using seeds seed, seed+1, ..."}),
+                "batch_seeds": ("STRING", {"default": "", "multiline": False, "tooltip": "Explicit comma-separated seed list (overrides seed/batch_count), one frame per seed."}),
             }
         }
 
@@ -25,6 +59,11 @@ class PatternGeneratorNode:
     FUNCTION = "generate_pattern"
     CATEGORY = "illusion"
 
+    @classmethod
+    def IS_CHANGED(cls, **kwargs):
+        # Nœud pur : la sortie ne change qu'avec les paramètres
+        return params_key(cls.__name__, kwargs)
+
     def _hex_to_rgb(self, hex_color_string):
         try:
             return ImageColor.getrgb(hex_color_string)
@@ -32,39 +71,55 @@ class PatternGeneratorNode:
             print(f"PatternGeneratorNode Warning: Invalid color string '{hex_color_string}'. Defaulting to black.")
             return (0, 0, 0)
 
-    def generate_pattern(self, width, height, pattern_type, color1_hex, color2_hex, parameter1, parameter2, seed):
-        np.random.seed(seed)
-        random.seed(seed)
+    def generate_pattern(self, width, height, pattern_type, color1_hex, color2_hex, parameter1, parameter2, seed,
+                         batch_count=1, batch_seeds=""):
+        # Pur à graine donnée : la même liste de graines redonne le même batch, mis en cache
+        seeds = resolve_batch_seeds(seed, batch_seeds, batch_count)
+        params = dict(width=width, height=height, pattern_type=pattern_type, color1_hex=color1_hex,
+                      color2_hex=color2_hex, parameter1=parameter1, parameter2=parameter2, seeds=seeds)
+        return (cached_tensor("PatternGeneratorNode", params, lambda: self.render_batch(**params)),)
+
+    def render_batch(self, width, height, pattern_type, color1_hex, color2_hex, parameter1, parameter2, seeds):
+        frames = map_frames(
+            lambda frame_seed: self._render_pattern(width, height, pattern_type, color1_hex, color2_hex,
+                                                    parameter1, parameter2, frame_seed),
+            seeds,
+        )
+        image_np = frames[0][np.newaxis] if len(frames) == 1 else np.stack(frames)
+        return image_np.astype(np.float32) / np.float32(255.0)
+
+    def _render_pattern(self, width, height, pattern_type, color1_hex, color2_hex, parameter1, parameter2, seed):
+        # Générateur isolé par appel (même séquence que np.random.seed(seed)) : l'état global
+        # n'est pas touché, plusieurs nœuds ou images peuvent donc tourner en parallèle.
+        rng = np.random.RandomState(seed % 2**32)
 
         c1 = self._hex_to_rgb(color1_hex)
         c2 = self._hex_to_rgb(color2_hex)
         
         image_np = np.zeros((height, width, 3), dtype=np.uint8)
 
+        # Tous les motifs réguliers sont construits par arithmétique d'indices diffusée (broadcast) :
+        # un masque 0/1 choisit la couleur dans la palette, sans boucle Python par pixel.
+        palette = np.array([c1, c2], dtype=np.uint8)
+        y_idx = np.arange(height)[:, np.newaxis]
+        x_idx = np.arange(width)[np.newaxis, :]
+
+        # Motifs périodiques : une seule période est indexée dans la palette, puis pavée par copies
         if pattern_type == "Stripes":
             stripe_width = max(1, parameter1) # Stripe width
             orientation = "Vertical" # Could be an input later
-            for y_coord in range(height):
-                for x_coord in range(width):
-                    if orientation == "Vertical":
-                        if (x_coord // stripe_width) % 2 == 0:
-                            image_np[y_coord, x_coord] = c1
-                        else:
-                            image_np[y_coord, x_coord] = c2
-                    else: # Horizontal
-                        if (y_coord // stripe_width) % 2 == 0:
-                            image_np[y_coord, x_coord] = c1
-                        else:
-                            image_np[y_coord, x_coord] = c2
+            period = np.arange(2 * stripe_width)
+            if orientation == "Vertical":
+                cell = palette[((period // stripe_width) % 2)[np.newaxis, :]]
+            else: # Horizontal
+                cell = palette[((period // stripe_width) % 2)[:, np.newaxis]]
+            image_np = tile_to(cell, height, width)
         
         elif pattern_type == "Checkerboard":
             square_size = max(1, parameter1) # Square size
-            for y_coord in range(height):
-                for x_coord in range(width):
-                    if ((x_coord // square_size) % 2 == (y_coord // square_size) % 2):
-                        image_np[y_coord, x_coord] = c1
-                    else:
-                        image_np[y_coord, x_coord] = c2
+            period = (np.arange(2 * square_size) // square_size) % 2
+            cell = palette[(period[:, np.newaxis] != period[np.newaxis, :]).astype(np.intp)]
+            image_np = tile_to(cell, height, width)
 
         elif pattern_type == "Random Dots":
             density_percent = np.clip(parameter1, 1, 100) # Density percentage
@@ -77,69 +132,52 @@ class PatternGeneratorNode:
             num_dots = max(10, num_dots) 
             num_dots = min(num_dots, width * height // 2) # Prevent extreme overdraw
 
-            pil_image = Image.fromarray(image_np) 
-            pil_image = pil_image.convert("RGB") 
-            pil_image.paste(c1, (0,0,width,height)) 
-            draw = ImageDraw.Draw(pil_image)
-
-            for _ in range(num_dots):
-                dot_x = random.randint(0, width - 1)
-                dot_y = random.randint(0, height - 1)
-                dot_radius = random.randint(dot_radius_min, dot_radius_max)
-                color_choice = c2 
-                
-                bbox = (dot_x - dot_radius, dot_y - dot_radius, 
-                        dot_x + dot_radius, dot_y + dot_radius)
-                try: # Add try-except for rare issues with ellipse on tiny images/radii
-                    draw.ellipse(bbox, fill=color_choice)
-                except ValueError:
-                    pass # Skip dot if it causes an issue
-            image_np = np.array(pil_image)
+            # Centres et rayons tirés en une fois, puis tampons de disques appliqués par rayon
+            dot_x = rng.randint(0, width, size=num_dots)
+            dot_y = rng.randint(0, height, size=num_dots)
+            dot_radius = rng.randint(dot_radius_min, int(dot_radius_max) + 1, size=num_dots)
+            dot_mask = stamp_dots(height, width, dot_x, dot_y, dot_radius)
+            image_np = palette[dot_mask.view(np.uint8)]
 
         elif pattern_type == "Solid Color":
             image_np[:, :] = c1
 
         elif pattern_type == "Gradient":
             direction = parameter1 % 4 # Gradient direction
-            for y_coord in range(height):
-                for x_coord in range(width):
-                    if direction == 0: # Left to Right
-                        ratio = x_coord / (width -1) if width > 1 else 0
-                    elif direction == 1: # Top to Bottom
-                        ratio = y_coord / (height -1) if height > 1 else 0
-                    elif direction == 2: # Right to Left
-                        ratio = (width - 1 - x_coord) / (width - 1) if width > 1 else 0
-                    else: # Bottom to Top (direction == 3)
-                        ratio = (height - 1 - y_coord) / (height - 1) if height > 1 else 0
-                    
-                    r_val = int(c1[0] * (1 - ratio) + c2[0] * ratio)
-                    g_val = int(c1[1] * (1 - ratio) + c2[1] * ratio)
-                    b_val = int(c1[2] * (1 - ratio) + c2[2] * ratio)
-                    image_np[y_coord, x_coord] = (r_val, g_val, b_val)
+            # Mêmes formules (float64) et même troncature que le calcul pixel par pixel
+            if direction == 0: # Left to Right
+                ratio = x_idx / (width - 1) if width > 1 else np.zeros_like(x_idx, dtype=np.float64)
+            elif direction == 1: # Top to Bottom
+                ratio = y_idx / (height - 1) if height > 1 else np.zeros_like(y_idx, dtype=np.float64)
+            elif direction == 2: # Right to Left
+                ratio = (width - 1 - x_idx) / (width - 1) if width > 1 else np.zeros_like(x_idx, dtype=np.float64)
+            else: # Bottom to Top (direction == 3)
+                ratio = (height - 1 - y_idx) / (height - 1) if height > 1 else np.zeros_like(y_idx, dtype=np.float64)
+
+            ratio = ratio[..., np.newaxis] # (H,1,1) ou (1,W,1)
+            c1_arr = np.array(c1, dtype=np.float64)
+            c2_arr = np.array(c2, dtype=np.float64)
+            line = (c1_arr * (1 - ratio) + c2_arr * ratio).astype(np.uint8)
+            image_np = np.ascontiguousarray(np.broadcast_to(line, (height, width, 3)))
         
         elif pattern_type == "Noise":
             is_grayscale_noise = parameter1 == 1 # 0 for color, 1 for grayscale
             block_scale = max(1, parameter2)      # Scale of noise blocks, 1 for pixel noise
 
-            for y_base in range(0, height, block_scale):
-                for x_base in range(0, width, block_scale):
-                    if is_grayscale_noise:
-                        val = random.randint(0, 255)
-                        chosen_color = (val, val, val)
-                    else:
-                        chosen_color = (random.randint(0, 255), 
-                                 random.randint(0, 255), 
-                                 random.randint(0, 255))
-                    
-                    for y_offset in range(block_scale):
-                        for x_offset in range(block_scale):
-                            y = y_base + y_offset
-                            x = x_base + x_offset
-                            if y < height and x < width:
-                                image_np[y, x] = chosen_color
+            # Un tirage par bloc, en un seul tableau, puis agrandissement des blocs par répétition
+            blocks_y = -(-height // block_scale)
+            blocks_x = -(-width // block_scale)
+            if is_grayscale_noise:
+                blocks = rng.randint(0, 256, size=(blocks_y, blocks_x, 1), dtype=np.uint8)
+                blocks = np.repeat(blocks, 3, axis=2)
+            else:
+                blocks = rng.randint(0, 256, size=(blocks_y, blocks_x, 3), dtype=np.uint8)
+
+            if block_scale > 1:
+                blocks = np.repeat(np.repeat(blocks, block_scale, axis=0), block_scale, axis=1)
+            image_np = np.ascontiguousarray(blocks[:height, :width])
         
-        image_tensor = torch.from_numpy(image_np.astype(np.float32) / 255.0).unsqueeze(0)
-        return (image_tensor,)
+        return image_np
 
 NODE_CLASS_MAPPINGS = {
     "PatternGeneratorNode": PatternGeneratorNode,
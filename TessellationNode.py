@@ -3,6 +3,9 @@ import numpy as np
 import torch
 import random
 
+from .batch_utils import map_frames, resolve_batch_seeds
+from .resampling import cached_resize
+
 class TessellationNode:
     CATEGORY = "illusion"
     FUNCTION = "tessellate"
@@ -27,11 +30,18 @@ class TessellationNode:
                 "scale_factor": ("FLOAT", {"default": 1.0, "min": 0.1, "max": 4.0}),
                 "opacity": ("FLOAT", {"default": 1.0, "min": 0.1, "max": 1.0}),
                 "random_seed": ("INT", {"default": 0, "min": 0, "max": 999999}),
+            },
+            "optional": {
+                "batch_count": ("INT", {"default": 1, "min": 1, "max": 4096, "step": 1, "tooltip": "Number of frames, using seeds random_seed, random_seed+1, ..."}),
+                "batch_seeds": ("STRING", {"default": "", "multiline": False, "tooltip": "Explicit comma-separated seed list (overrides random_seed/batch_count), one frame per seed."}),
             }
         }
 
-    def tensor_to_pil(self, img_tensor):
+    def tensor_to_pil(self, img_tensor, size=None):
+        # size (largeur, hauteur) : redimensionnement Lanczos en float avant l'unique conversion 8 bits
         arr = img_tensor[0] if isinstance(img_tensor, list) or len(img_tensor.shape) == 4 else img_tensor
+        if size is not None:
+            arr = cached_resize(torch.as_tensor(arr), size[0], size[1], "lanczos")
         arr = arr.cpu().numpy() if hasattr(arr, 'cpu') else arr
         arr = np.clip(arr, 0, 1)
         arr = (arr * 255).astype(np.uint8)
@@ -55,12 +65,27 @@ class TessellationNode:
         scale_mode,
         scale_factor,
         opacity,
-        random_seed
+        random_seed,
+        batch_count=1,
+        batch_seeds=""
     ):
-        random.seed(random_seed)
-        base_tile = self.tensor_to_pil(input_image).convert("RGBA")
-        if base_tile.size != (tile_width, tile_height):
-            base_tile = base_tile.resize((tile_width, tile_height), resample=Image.LANCZOS)
+        base_tile = self.tensor_to_pil(input_image, (tile_width, tile_height)).convert("RGBA")
+
+        seeds = resolve_batch_seeds(random_seed, batch_seeds, batch_count)
+        frames = map_frames(
+            lambda seed: self._compose(
+                base_tile, tile_width, tile_height, tiles_x, tiles_y, mode, mirror_axis, offset_x, offset_y,
+                rotation_mode, rotation_angle, scale_mode, scale_factor, opacity, seed
+            ),
+            seeds,
+        )
+        tensor = torch.from_numpy(np.stack(frames))
+        return (tensor,)
+
+    def _compose(self, base_tile, tile_width, tile_height, tiles_x, tiles_y, mode, mirror_axis, offset_x, offset_y,
+                 rotation_mode, rotation_angle, scale_mode, scale_factor, opacity, random_seed):
+        # Générateur isolé par appel (même séquence que random.seed) : l'état global n'est pas modifié.
+        rng = random.Random(random_seed)
 
         # Canvas size for diamond mode
         if mode == "diamond":
@@ -82,7 +107,7 @@ class TessellationNode:
                     tw, th = max(8, int(tile_width * fac)), max(8, int(tile_height * fac))
                     tile = tile.resize((tw, th), resample=Image.LANCZOS)
                 elif scale_mode == "random":
-                    fac = scale_factor * random.uniform(0.85, 1.15)
+                    fac = scale_factor * rng.uniform(0.85, 1.15)
                     tw, th = max(8, int(tile_width * fac)), max(8, int(tile_height * fac))
                     tile = tile.resize((tw, th), resample=Image.LANCZOS)
                 else:
@@ -93,7 +118,7 @@ class TessellationNode:
                 if rotation_mode == "by_tile":
                     angle = rotation_angle * ((ix + iy) % 4)
                 elif rotation_mode == "random":
-                    angle = random.uniform(0, rotation_angle)
+                    angle = rng.uniform(0, rotation_angle)
                 if angle != 0:
                     tile = tile.rotate(angle, expand=True, fillcolor=(0,0,0,0))
 
@@ -104,8 +129,8 @@ class TessellationNode:
                     tile = tile.transpose(Image.FLIP_TOP_BOTTOM)
                 if mirror_axis == "xy" and ((ix + iy) % 2 == 1):
                     tile = tile.transpose(Image.ROTATE_180)
-                if mirror_axis == "random" and random.random() < 0.5:
-                    tile = tile.transpose(random.choice([
+                if mirror_axis == "random" and rng.random() < 0.5:
+                    tile = tile.transpose(rng.choice([
                         Image.FLIP_LEFT_RIGHT,
                         Image.FLIP_TOP_BOTTOM,
                         Image.ROTATE_180
@@ -129,9 +154,7 @@ class TessellationNode:
 
                 result.alpha_composite(tile, (int(px), int(py)))
 
-        arr_out = np.array(result.convert("RGB")).astype(np.float32) / 255.0
-        tensor = torch.from_numpy(arr_out).unsqueeze(0)
-        return (tensor,)
+        return np.array(result.convert("RGB")).astype(np.float32) / 255.0
 
 NODE_CLASS_MAPPINGS = {
     "TessellationNode": TessellationNode,
@@ -1,10 +1,13 @@
-import numpy as np
 import torch
-from PIL import Image
+
+from .batch_utils import map_frames
+from .periodic_tiling import tile_to
+from .resampling import cached_resize
 
 class TileImageRepeaterNode:
     RESIZE_MODES = ["None", "Width", "Height", "Shortest Side", "Longest Side"] # Ajout de None, et de Shortest/Longest Side
     RESAMPLING_FILTERS = ["lanczos", "bicubic", "bilinear", "nearest"]
+    OUTPUT_DTYPES = {"float32": torch.float32, "float16": torch.float16, "uint8": torch.uint8}
 
     @classmethod
     def INPUT_TYPES(cls):
@@ -16,6 +19,12 @@ class TileImageRepeaterNode:
                 "resize_mode": (cls.RESIZE_MODES, {"default": "None"}),
                 "tile_target_size": ("INT", {"default": 256, "min": 0, "max": 8192, "step": 8, "tooltip": "Target size for the chosen dimension (Width, Height, Shortest/Longest Side). 0 or 'None' mode to disable resize."}),
                 "resampling_filter": (cls.RESAMPLING_FILTERS, {"default": "lanczos"}),
+            },
+            "optional": {
+                "output_dtype": (list(cls.OUTPUT_DTYPES), {"default": "float32", "tooltip": "float16 halves and uint8 (0-255) quarters the output memory. uint8 is only for nodes that accept it."}),
+                "frame_count": ("INT", {"default": 1, "min": 1, "max": 1024, "tooltip": "Number of frames of a scrolling animation (1 = still image). Frame i is shifted by i * (scroll_dx, scroll_dy)."}),
+                "scroll_dx": ("INT", {"default": 0, "min": -4096, "max": 4096, "tooltip": "Horizontal scroll in pixels per frame (positive = right)."}),
+                "scroll_dy": ("INT", {"default": 0, "min": -4096, "max": 4096, "tooltip": "Vertical scroll in pixels per frame (positive = down)."}),
             }
         }
 
@@ -23,7 +32,8 @@ class TileImageRepeaterNode:
     FUNCTION = "repeat_image_as_tiles"
     CATEGORY = "illusion"
 
-    def repeat_image_as_tiles(self, image, horizontal_repeats, vertical_repeats, resize_mode, tile_target_size, resampling_filter):
+    def repeat_image_as_tiles(self, image, horizontal_repeats, vertical_repeats, resize_mode, tile_target_size, resampling_filter,
+                              output_dtype="float32", frame_count=1, scroll_dx=0, scroll_dy=0):
         if not isinstance(image, torch.Tensor):
             if isinstance(image, list) and len(image) > 0 and isinstance(image[0], torch.Tensor):
                 image_tensor = image[0]
@@ -39,18 +49,10 @@ class TileImageRepeaterNode:
         else:
              raise ValueError(f"Input image tensor must be 3D (H,W,C) or 4D (B,H,W,C), got {image_tensor.ndim}D shape: {image_tensor.shape}")
 
-        single_image_hwc_float = image_bchw_float[0].cpu().numpy()
-        
-        pil_image_mode = 'RGB'
-        if single_image_hwc_float.ndim == 3 and single_image_hwc_float.shape[2] == 1:
-            pil_image_mode = 'L'
-        elif single_image_hwc_float.ndim == 2: # Si c'est déjà 2D (grayscale)
-            pil_image_mode = 'L'
-            
-        pil_image = Image.fromarray((single_image_hwc_float * 255).squeeze().astype(np.uint8), mode=pil_image_mode)
-        
-        original_width, original_height = pil_image.size
-        resized_image_hwc_float = single_image_hwc_float # Par défaut, pas de redimensionnement
+        # Tout le batch est traité d'un coup : taille cible calculée une fois, un seul redimensionnement
+        batch_bhwc_float = image_bchw_float.cpu().float()
+        original_height, original_width = batch_bhwc_float.shape[1:3]
+        resized_bhwc_float = batch_bhwc_float # Par défaut, pas de redimensionnement
 
         if resize_mode != "None" and tile_target_size > 0:
             target_w = original_width
@@ -83,46 +85,48 @@ class TileImageRepeaterNode:
             target_h = max(1, target_h)
 
             if (target_w != original_width or target_h != original_height):
-                resampling_map = {
-                    "lanczos": Image.Resampling.LANCZOS, "bicubic": Image.Resampling.BICUBIC,
-                    "bilinear": Image.Resampling.BILINEAR, "nearest": Image.Resampling.NEAREST
-                }
-                resample_pil = resampling_map.get(resampling_filter, Image.Resampling.LANCZOS)
-                
-                print(f"TileImageRepeaterNode: Resizing tile from {original_width}x{original_height} to {target_w}x{target_h} using {resampling_filter}")
-                pil_image_resized = pil_image.resize((target_w, target_h), resample=resample_pil)
-                
-                # Reconvertir en NumPy array et s'assurer qu'il a 3 canaux si l'original en avait 3
-                resized_np = np.array(pil_image_resized).astype(np.float32) / 255.0
-                if resized_np.ndim == 2: # Si PIL retourne une image en niveaux de gris (L mode)
-                    resized_image_hwc_float = np.stack((resized_np,) * 3, axis=-1) if single_image_hwc_float.shape[2] == 3 else resized_np[:,:,np.newaxis]
-                else: # Déjà RGB
-                    resized_image_hwc_float = resized_np
-            else:
-                 resized_image_hwc_float = single_image_hwc_float # Aucune redimension effective
-        else: # resize_mode == "None" or tile_target_size == 0
-            resized_image_hwc_float = single_image_hwc_float
-
+                print(f"TileImageRepeaterNode: Resizing {len(batch_bhwc_float)} tile(s) from {original_width}x{original_height} to {target_w}x{target_h} using {resampling_filter}")
+                # Redimensionnement en float, canaux conservés (pas de passage par PIL ni par 8 bits)
+                resized_bhwc_float = cached_resize(batch_bhwc_float, target_w, target_h, resampling_filter)
 
-        # S'assurer que le nombre de canaux est correct après toutes les opérations
-        # Surtout si l'entrée était grayscale
-        if single_image_hwc_float.shape[2] == 1 and resized_image_hwc_float.ndim == 3 and resized_image_hwc_float.shape[2] == 3:
-            # Si l'entrée était grayscale mais que le redimensionnement a produit RGB (ex: mode 'L' vers 'RGB'), prendre la moyenne
-            resized_image_hwc_float = np.mean(resized_image_hwc_float, axis=2, keepdims=True)
-        elif single_image_hwc_float.shape[2] == 3 and resized_image_hwc_float.ndim == 2:
-            # Si l'entrée était RGB mais que le redimensionnement a produit Grayscale, répéter le canal
-            resized_image_hwc_float = np.stack((resized_image_hwc_float,) * 3, axis=-1)
-        elif single_image_hwc_float.shape[2] == 3 and resized_image_hwc_float.ndim == 3 and resized_image_hwc_float.shape[2] == 1:
-             resized_image_hwc_float = np.repeat(resized_image_hwc_float, 3, axis=2)
+        # Pavage sans tableau intermédiaire : les dalles (converties une seule fois au type de sortie)
+        # sont recopiées par blocs doublants directement dans le tenseur de sortie, pour toutes les images
+        # du batch à la fois. Une répétition 1x1 au type d'origine renvoie les dalles elles-mêmes.
+        tile = resized_bhwc_float.contiguous()
+        dtype = self.OUTPUT_DTYPES.get(output_dtype, torch.float32)
+        if dtype == torch.uint8:
+            tile = (tile.clamp(0.0, 1.0) * 255.0).round_().to(torch.uint8)
+        else:
+            tile = tile.to(dtype)
+        if frame_count > 1:
+            return (self.scroll_frames(tile, horizontal_repeats, vertical_repeats, frame_count, scroll_dx, scroll_dy),)
+        if horizontal_repeats == 1 and vertical_repeats == 1:
+            return (tile,)
 
+        batch, tile_h, tile_w, channels = tile.shape
+        output_tensor_bhwc = torch.empty((batch, vertical_repeats * tile_h, horizontal_repeats * tile_w, channels), dtype=dtype)
+        # Vues (H, W, B, C) : tile_to pave les deux premiers axes, le batch suit dans chaque copie
+        tile_to(tile.permute(1, 2, 0, 3), vertical_repeats * tile_h, horizontal_repeats * tile_w,
+                out=output_tensor_bhwc.permute(1, 2, 0, 3))
 
-        tiled_image_np_float = np.tile(resized_image_hwc_float, 
-                                       (vertical_repeats, horizontal_repeats, 1))
-        
-        output_tensor_bhwc = torch.from_numpy(tiled_image_np_float).unsqueeze(0)
-        
         return (output_tensor_bhwc,)
 
+    def scroll_frames(self, tiles, horizontal_repeats, vertical_repeats, frame_count, scroll_dx, scroll_dy):
+        # Animation de défilement : l'image i est la toile pavée décalée de i * (dx, dy). La toile pavée
+        # n'est jamais construite : la dalle est décalée circulairement (indices modulo sa taille), puis
+        # pavée directement dans l'image de sortie. Mémoire de travail : une dalle par image en cours.
+        # Avec un batch d'entrée, l'image i utilise la dalle i modulo la taille du batch.
+        batch, tile_h, tile_w, channels = tiles.shape
+        height, width = vertical_repeats * tile_h, horizontal_repeats * tile_w
+        frames = torch.empty((frame_count, height, width, channels), dtype=tiles.dtype)
+
+        def render_frame(i):
+            shifted = torch.roll(tiles[i % batch], shifts=((i * scroll_dy) % tile_h, (i * scroll_dx) % tile_w), dims=(0, 1))
+            tile_to(shifted, height, width, out=frames[i])
+
+        map_frames(render_frame, range(frame_count))
+        return frames
+
 NODE_CLASS_MAPPINGS = {
     "TileImageRepeaterNode": TileImageRepeaterNode
 }
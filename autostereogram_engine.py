@@ -0,0 +1,313 @@
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+
+from .batch_utils import map_frames
+
+# Moteur vectorisé pour AdvancedAutostereogramNode.
+# Produit exactement la même sortie que la boucle pixel par pixel de référence,
+# mais traite un bloc de lignes entier avec quelques opérations NumPy.
+
+
+def separation_dtype(depth_scale_factor, period):
+    # La boucle de référence calcule `depth_value * depth_scale_factor * period` sur un scalaire
+    # NumPy float32 ; selon la version de NumPy le résultat est float32 ou float64.
+    # On reproduit le même type pour que l'arrondi soit identique au bit près.
+    return np.asarray(np.float32(1.0) * depth_scale_factor * period).dtype
+
+
+def compute_separation(depth_rows, eye_separation_pixels, depth_scale_factor):
+    # depth_rows : (N, W) float32 [0,1] -> (N, W) int32
+    dtype = separation_dtype(depth_scale_factor, eye_separation_pixels)
+    sep = depth_rows.astype(dtype, copy=False) * depth_scale_factor * eye_separation_pixels
+    return np.rint(sep).astype(np.int32)
+
+
+def compute_links(depth_rows, eye_separation_pixels, depth_scale_factor):
+    # Calcule, pour chaque pixel, la colonne source dans le "motif virtuel" de période
+    # eye_separation_pixels. Équivaut au tableau `links` de la boucle de référence.
+    depth_rows = np.atleast_2d(depth_rows)
+    sep = compute_separation(depth_rows, eye_separation_pixels, depth_scale_factor)
+    return links_from_separation(sep, eye_separation_pixels)
+
+
+def links_from_separation(sep, eye_separation_pixels):
+    # sep : (N, W) int -> links : (N, W) int32, valeurs dans [0, eye_separation_pixels)
+    period = eye_separation_pixels
+    n, w = sep.shape
+    cols = np.arange(w, dtype=np.int32)
+
+    # Dans la boucle de référence, links[x_linked] n'est défini que pour x_linked < x
+    # (links est remis à -1 à chaque ligne). Un pixel est donc lié à x_linked si
+    # 0 <= x_linked < x, sinon c'est un point d'ancrage (parent = lui-même).
+    x_linked = cols - period + sep
+    linked = (x_linked >= 0) & (x_linked < cols)
+    parent = np.where(linked, x_linked, cols).astype(np.int32)
+
+    # Remontée des chaînes par sauts de pointeurs : O(log longueur de chaîne) passes.
+    while True:
+        grandparent = np.take_along_axis(parent, parent, axis=1)
+        if np.array_equal(grandparent, parent):
+            break
+        parent = grandparent
+
+    # La racine de chaque chaîne est un ancrage, dont la source vaut root % period.
+    return parent % np.int32(period)
+
+
+def render_rows(links, pattern_np, row_start=0, out=None, row_index=None):
+    # Remplit les lignes [row_start, row_start + N) du stéréogramme avec un seul gather.
+    # row_index permet de donner explicitement les indices (non contigus) des lignes.
+    # links : (N, W) int, pattern_np : (PatH, PatW, C)
+    pat_h, pat_w, pat_c = pattern_np.shape
+    n, w = links.shape
+    if row_index is None:
+        row_index = np.arange(row_start, row_start + n, dtype=np.intp)
+    rows = (np.asarray(row_index, dtype=np.intp) % pat_h)[:, np.newaxis]
+    flat_index = rows * pat_w + links % pat_w
+    flat_pattern = np.ascontiguousarray(pattern_np).reshape(pat_h * pat_w, pat_c)
+    if out is None:
+        out = np.empty((n, w, pat_c), dtype=pattern_np.dtype)
+    # mode='clip' : indices déjà valides, évite le tampon intermédiaire de mode='raise'
+    np.take(flat_pattern, flat_index, axis=0, out=out, mode='clip')
+    return out
+
+
+def render_stereogram_batch(depth_frames, patterns, eye_separation_pixels, depth_scale_factor,
+                            out=None, band_rows=256, workers=1, links_out=None):
+    # depth_frames : (B, H, W) float32 [0,1] -> stéréogrammes (B, H, W, C)
+    # patterns : un motif (PatH, PatW, C) partagé par toutes les images, ou une séquence de B motifs.
+    # Les lignes sont indépendantes : chaque image est découpée en bandes et chaque bande écrit
+    # directement dans sa tranche de `out` (aucune copie par bande). Les opérations NumPy utilisées
+    # libèrent le GIL, un pool de threads suffit donc ; le résultat ne dépend pas de l'ordonnancement.
+    # links_out : (B, H, W) int32 optionnel, reçoit la carte des liens (voir apply_link_map).
+    b, h, w = depth_frames.shape
+    if isinstance(patterns, np.ndarray):
+        patterns = [patterns] * b
+    if out is None:
+        out = np.empty((b, h, w, patterns[0].shape[2]), dtype=patterns[0].dtype)
+
+    def render_band(task):
+        i, y0 = task
+        y1 = min(h, y0 + band_rows)
+        links = compute_links(depth_frames[i, y0:y1], eye_separation_pixels, depth_scale_factor)
+        render_rows(links, patterns[i], row_start=y0, out=out[i, y0:y1])
+        if links_out is not None:
+            links_out[i, y0:y1] = links
+
+    map_frames(render_band, [(i, y0) for i in range(b) for y0 in range(0, h, band_rows)], workers)
+    return out
+
+
+def render_parameter_sweep(depth_2d, pattern_np, combinations, out=None, band_rows=256, workers=1):
+    # Une image par couple (eye_separation_pixels, depth_scale_factor), toutes à partir de la même
+    # carte de profondeur déjà prétraitée. Bandes de toutes les combinaisons sur le même pool.
+    h, w = depth_2d.shape
+    if out is None:
+        out = np.empty((len(combinations), h, w, pattern_np.shape[2]), dtype=pattern_np.dtype)
+
+    def render_band(task):
+        k, y0 = task
+        eye_separation_pixels, depth_scale_factor = combinations[k]
+        y1 = min(h, y0 + band_rows)
+        links = compute_links(depth_2d[y0:y1], eye_separation_pixels, depth_scale_factor)
+        render_rows(links, pattern_np, row_start=y0, out=out[k, y0:y1])
+
+    map_frames(render_band, [(k, y0) for k in range(len(combinations)) for y0 in range(0, h, band_rows)], workers)
+    return out
+
+
+def render_stereogram(depth_2d, pattern_np, eye_separation_pixels, depth_scale_factor,
+                      out=None, band_rows=256, workers=1):
+    # depth_2d : (H, W) float32 [0,1] -> stéréogramme (H, W, C)
+    out = None if out is None else out[np.newaxis]
+    return render_stereogram_batch(depth_2d[np.newaxis], pattern_np, eye_separation_pixels, depth_scale_factor,
+                                   out=out, band_rows=band_rows, workers=workers)[0]
+
+
+def row_fingerprint(sep_row, eye_separation_pixels):
+    # Les liens ne dépendent que de la ligne de séparation (profondeur quantifiée) et de la période :
+    # deux lignes de profondeur légèrement différentes mais de même séparation partagent l'entrée.
+    digest = hashlib.blake2b(np.ascontiguousarray(sep_row).tobytes(), digest_size=16).digest()
+    return (int(eye_separation_pixels), sep_row.shape[0], digest)
+
+
+def pattern_fingerprint(pattern_np):
+    return hashlib.blake2b(np.ascontiguousarray(pattern_np).tobytes(), digest_size=16).digest() + \
+        repr(pattern_np.shape).encode()
+
+
+class TemporalLinkCache:
+    # Mode incrémental pour les séquences : cache LRU borné empreinte de ligne -> ligne de liens,
+    # plus la dernière image rendue pour recopier les lignes inchangées d'une image à l'autre.
+    # Conservé entre exécutions du nœud, de sorte qu'une séquence rendue image par image en profite aussi.
+
+    def __init__(self, max_rows=16384):
+        self.max_rows = max(1, int(max_rows))
+        self._links = OrderedDict()
+        self._previous = None # (empreintes des lignes, empreinte du motif, image rendue)
+        self.hits = 0
+        self.misses = 0
+        self.reused_rows = 0
+
+    def clear(self):
+        self._links.clear()
+        self._previous = None
+
+    def lookup(self, sep_rows, keys, eye_separation_pixels):
+        # Retourne les liens de sep_rows ; seules les lignes d'empreinte inconnue sont calculées,
+        # une seule fois même si elles se répètent dans l'image (fonds uniformes).
+        links = np.empty(sep_rows.shape, dtype=np.int32)
+        missing = OrderedDict()
+        for i, key in enumerate(keys):
+            cached = self._links.get(key)
+            if cached is not None:
+                self._links.move_to_end(key)
+                links[i] = cached
+                self.hits += 1
+            else:
+                missing.setdefault(key, []).append(i)
+
+        if missing:
+            first_rows = [indices[0] for indices in missing.values()]
+            computed = links_from_separation(sep_rows[first_rows], eye_separation_pixels)
+            for (key, indices), row in zip(missing.items(), computed):
+                links[indices] = row
+                # Copie : une vue garderait tout le bloc calculé en mémoire tant qu'une de ses lignes reste
+                self._links[key] = row.copy()
+                self.misses += 1
+                self.hits += len(indices) - 1
+            while len(self._links) > self.max_rows:
+                self._links.popitem(last=False)
+        return links
+
+    def render(self, depth_frames, patterns, eye_separation_pixels, depth_scale_factor, out=None, links_out=None):
+        # Même sortie que render_stereogram_batch. Les images sont traitées dans l'ordre,
+        # chacune pouvant réutiliser les lignes de la précédente.
+        b, h, w = depth_frames.shape
+        if isinstance(patterns, np.ndarray):
+            patterns = [patterns] * b
+        if out is None:
+            out = np.empty((b, h, w, patterns[0].shape[2]), dtype=patterns[0].dtype)
+
+        pattern_keys = {}
+        previous = self._previous
+        for i in range(b):
+            pattern_key = pattern_keys.get(id(patterns[i]))
+            if pattern_key is None:
+                pattern_key = pattern_keys[id(patterns[i])] = pattern_fingerprint(patterns[i])
+
+            sep = compute_separation(depth_frames[i], eye_separation_pixels, depth_scale_factor)
+            keys = [row_fingerprint(row, eye_separation_pixels) for row in sep]
+
+            todo = np.ones(h, dtype=bool)
+            if previous is not None:
+                prev_keys, prev_pattern_key, prev_frame = previous
+                if prev_pattern_key == pattern_key and prev_frame.shape == out[i].shape:
+                    todo = np.fromiter((k != pk for k, pk in zip(keys, prev_keys)), dtype=bool, count=h)
+                    unchanged = ~todo
+                    out[i][unchanged] = prev_frame[unchanged]
+                    self.reused_rows += int(unchanged.sum())
+
+            if links_out is not None:
+                # La carte des liens est demandée pour toutes les lignes, même celles recopiées
+                links_out[i] = self.lookup(sep, keys, eye_separation_pixels)
+            rows = np.flatnonzero(todo)
+            if rows.size:
+                if links_out is not None:
+                    links = links_out[i][rows]
+                else:
+                    links = self.lookup(sep[rows], [keys[y] for y in rows], eye_separation_pixels)
+                out[i][rows] = render_rows(links, patterns[i], row_index=rows)
+            previous = (keys, pattern_key, out[i])
+
+        if b:
+            # Copie : la sortie appartient à l'appelant et peut être modifiée par la suite
+            self._previous = (previous[0], previous[1], previous[2].copy())
+        return out
+
+
+def apply_link_map(link_map, pattern_np, out=None):
+    # Retexture : applique un motif à une carte de liens déjà calculée, un gather par image.
+    # link_map : (B, H, W) int, colonnes sources dans le motif virtuel -> (B, H, W, C)
+    b, h, w = link_map.shape
+    if out is None:
+        out = np.empty((b, h, w, pattern_np.shape[2]), dtype=pattern_np.dtype)
+    for i in range(b):
+        render_rows(link_map[i], pattern_np, row_start=0, out=out[i])
+    return out
+
+
+# --- Rendu en flux (out-of-core) ---
+# Les lignes étant indépendantes, une image de taille quelconque peut être rendue bande par bande :
+# la carte de profondeur est lue depuis un fichier mappé en mémoire et chaque bande rendue est écrite
+# directement dans la sortie mappée. La mémoire de travail est bornée par la taille d'une bande.
+
+OUTPUT_FORMATS = ["npy_uint8", "npy_float32", "raw_uint8"]
+RAW_DTYPES = ["uint8", "uint16", "float32"]
+
+
+def open_depth_source(path, raw_width=0, raw_height=0, raw_dtype="uint8"):
+    # .npy : mappé en lecture seule. Autre extension : fichier brut (H, W) de type raw_dtype.
+    if path.lower().endswith(".npy"):
+        return np.load(path, mmap_mode="r")
+    if raw_width <= 0 or raw_height <= 0:
+        raise ValueError("raw_width and raw_height are required to read a raw depth file.")
+    return np.memmap(path, dtype=np.dtype(raw_dtype), mode="r", shape=(raw_height, raw_width))
+
+
+def open_stream_output(path, height, width, channels, output_format):
+    if output_format == "npy_uint8":
+        return np.lib.format.open_memmap(path, mode="w+", dtype=np.uint8, shape=(height, width, channels))
+    if output_format == "npy_float32":
+        return np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=(height, width, channels))
+    if output_format == "raw_uint8":
+        return np.memmap(path, mode="w+", dtype=np.uint8, shape=(height, width, channels))
+    raise ValueError(f"Unsupported output format: {output_format}")
+
+
+def depth_divisor(depth_source, band_rows=256):
+    # Entiers -> divisés par le maximum de leur type (uint8 / 255, uint16 / 65535) : contrairement au
+    # nœud, qui ne voit que des images 8 bits, un fichier brut 16 bits garde toute sa plage.
+    # Flottants -> même règle que le nœud : maximum > 1.1 -> divisés par 255, sinon déjà dans [0, 1].
+    # Le maximum des flottants est cherché bande par bande pour ne jamais charger tout le fichier.
+    if np.issubdtype(depth_source.dtype, np.integer):
+        return float(np.iinfo(depth_source.dtype).max)
+    h = depth_source.shape[0]
+    maximum = max(float(np.max(depth_source[y0:y0 + band_rows])) for y0 in range(0, h, band_rows))
+    return 255.0 if maximum > 1.1 else 1.0
+
+
+def depth_band_to_float(band, divisor):
+    # (N, W) ou (N, W, C), type quelconque -> (N, W) float32 [0,1]
+    band = np.asarray(band, dtype=np.float32)
+    if divisor != 1.0:
+        band = band / np.float32(divisor)
+    band = np.clip(band, 0.0, 1.0)
+    if band.ndim == 3:
+        band = np.mean(band, axis=2) if band.shape[2] > 1 else band[..., 0]
+    return band
+
+
+def stream_stereogram(depth_source, pattern_np, eye_separation_pixels, depth_scale_factor, output,
+                      band_rows=256, workers=1):
+    # depth_source : (H, W) ou (H, W, C), de préférence np.memmap ; output : (H, W, C) mappé en mémoire.
+    # Chaque bande est lue, rendue puis écrite dans output ; rien n'est conservé au-delà de la bande.
+    h = depth_source.shape[0]
+    divisor = depth_divisor(depth_source, band_rows)
+    to_uint8 = output.dtype == np.uint8
+
+    def render_band(y0):
+        y1 = min(h, y0 + band_rows)
+        depth = depth_band_to_float(depth_source[y0:y1], divisor)
+        links = compute_links(depth, eye_separation_pixels, depth_scale_factor)
+        band = render_rows(links, pattern_np, row_start=y0)
+        if to_uint8:
+            band = (np.clip(band, 0.0, 1.0) * 255).astype(np.uint8)
+        output[y0:y1] = band
+
+    map_frames(render_band, range(0, h, band_rows), workers)
+    if hasattr(output, "flush"):
+        output.flush()
+    return output
@@ -1,8 +1,19 @@
+import os
+
 import numpy as np
 import torch
 from PIL import Image
 
+from .autostereogram_engine import (
+    OUTPUT_FORMATS, RAW_DTYPES, TemporalLinkCache, apply_link_map, open_depth_source, open_stream_output,
+    render_parameter_sweep, render_stereogram_batch, stream_stereogram,
+)
+
 class AdvancedAutostereogramNode: # Le nom de la classe est AdvancedAutostereogramNode
+    ENGINES = ["vectorized", "reference"]
+    PHASE_MODES = ["none", "fixed", "per_frame"]
+    BAND_ROWS = 256 # Nombre de lignes traitées par passe vectorisée (borne la mémoire temporaire)
+
     @classmethod
     def INPUT_TYPES(cls):
         return {
@@ -12,9 +23,19 @@ class AdvancedAutostereogramNode: # Le nom de la classe est AdvancedAutostereogr
                 "eye_separation_pixels": ("INT", {"default": 100, "min": 30, "max": 400, "step": 1, "tooltip": "Typical eye separation projected onto the image plane in pixels. Influences pattern period and perceived depth."}),
                 "depth_scale_factor": ("FLOAT", {"default": 0.5, "min": 0.01, "max": 2.0, "step": 0.01, "tooltip": "Scales the depth effect. Values around 0.3-0.7 are common. Higher values = more 'pop-out'."}),
             },
+            "optional": {
+                "engine": (cls.ENGINES, {"default": "vectorized", "tooltip": "vectorized: NumPy linking engine (fast). reference: original per-pixel loop. Both give identical output."}),
+                "workers": ("INT", {"default": 1, "min": 0, "max": 256, "step": 1, "tooltip": "Number of threads rendering row bands in parallel (vectorized engine). 0 = one per CPU core."}),
+                "pattern_phase": (cls.PHASE_MODES, {"default": "none", "tooltip": "Random offset of the pattern. none: no offset. fixed: one offset shared by every frame (temporally coherent). per_frame: a new offset for each frame."}),
+                "phase_seed": ("INT", {"default": 0, "min": 0, "max": 0xFFFFFFFF}),
+                "incremental": ("BOOLEAN", {"default": False, "tooltip": "Reuse links and output rows whose depth did not change since the previous frame (also across executions), and link repeated rows only once. Frames are processed in order."}),
+                "link_cache_rows": ("INT", {"default": 16384, "min": 1, "max": 1048576, "step": 1, "tooltip": "Maximum number of distinct depth rows kept by the incremental cache (LRU eviction)."}),
+                "output_link_map": ("BOOLEAN", {"default": False, "tooltip": "Also output the per-pixel source-column map (int32), to re-texture the same depth map with other patterns via 'Autostereogram Re-texture'."}),
+            },
         }
 
-    RETURN_TYPES = ("IMAGE",)
+    RETURN_TYPES = ("IMAGE", "STEREO_LINK_MAP")
+    RETURN_NAMES = ("image", "link_map")
     FUNCTION = "create_advanced_autostereogram" # La fonction à appeler
     CATEGORY = "illusion"
 
@@ -80,18 +101,58 @@ class AdvancedAutostereogramNode: # Le nom de la classe est AdvancedAutostereogr
         return img_np
 
 
-    def create_advanced_autostereogram(self, depth_map, pattern, eye_separation_pixels, depth_scale_factor):
-        depth_map_np = self.preprocess_image_to_numpy(depth_map, is_depth_map=True) # H, W, 1, float [0,1]
-        pattern_np = self.preprocess_image_to_numpy(pattern, target_channels=3)     # PatH, PatW, 3, float [0,1]
+    def preprocess_depth_batch(self, depth_map):
+        # Comme preprocess_image_to_numpy(is_depth_map=True), mais conserve toutes les images du batch.
+        # Retourne (B, H, W) float32 [0,1].
+        if not isinstance(depth_map, torch.Tensor) or depth_map.ndim != 4:
+            return self.preprocess_image_to_numpy(depth_map, is_depth_map=True)[np.newaxis, :, :, 0]
 
-        h, w, _ = depth_map_np.shape
-        pat_h, pat_w, pat_c = pattern_np.shape
+        # Pas de clone : aucune opération ci-dessous ne modifie le tenseur d'origine
+        frames = depth_map.detach().cpu().numpy().astype(np.float32, copy=False) # B,H,W,C
+        # Normalisation décidée image par image, comme pour une image seule
+        maxima = frames.reshape(frames.shape[0], -1).max(axis=1)
+        divisors = np.where(maxima > 1.1, 255.0, 1.0).astype(np.float32)[:, np.newaxis, np.newaxis, np.newaxis]
+        frames = np.clip(frames / divisors, 0.0, 1.0)
+        if frames.shape[3] > 1: # RGB -> grayscale
+            return np.mean(frames, axis=3)
+        return frames[..., 0]
 
-        if pat_w == 0:
-            raise ValueError("Pattern width cannot be zero.")
-        if eye_separation_pixels <=0:
-            raise ValueError("Eye separation in pixels must be positive.")
+    def _phase_patterns(self, pattern_np, frame_count, pattern_phase, phase_seed):
+        # Décalage aléatoire (dy, dx) du motif, appliqué une fois par motif plutôt que par pixel.
+        # Générateur isolé : l'état global de np.random n'est pas modifié.
+        if pattern_phase == "none":
+            return [pattern_np] * frame_count
+        pat_h, pat_w, _ = pattern_np.shape
+        rng = np.random.default_rng(phase_seed)
+        draws = 1 if pattern_phase == "fixed" else frame_count
+        shifted = [
+            np.roll(pattern_np, (-int(rng.integers(pat_h)), -int(rng.integers(pat_w))), axis=(0, 1))
+            for _ in range(draws)
+        ]
+        return shifted * frame_count if draws == 1 else shifted
+
+    def _render_vectorized(self, depth_frames, patterns, eye_separation_pixels, depth_scale_factor, workers=1, links_out=None):
+        # Même résultat que _render_reference : séparation et liens calculés par bandes de lignes,
+        # puis chaque bande est remplie par un seul gather dans le motif. Bandes de toutes les
+        # images réparties sur le même pool de threads.
+        return render_stereogram_batch(depth_frames, patterns, eye_separation_pixels, depth_scale_factor,
+                                       band_rows=self.BAND_ROWS, workers=workers, links_out=links_out)
 
+    def _render_incremental(self, depth_frames, patterns, eye_separation_pixels, depth_scale_factor, link_cache_rows, links_out=None):
+        cache = getattr(self, "_temporal_cache", None)
+        if cache is None:
+            cache = self._temporal_cache = TemporalLinkCache(link_cache_rows)
+        cache.max_rows = max(1, int(link_cache_rows))
+        hits, misses, reused = cache.hits, cache.misses, cache.reused_rows
+        stereogram = cache.render(depth_frames, patterns, eye_separation_pixels, depth_scale_factor, links_out=links_out)
+        print(f"AdvancedAutostereogramNode: incremental mode reused {cache.reused_rows - reused} row(s), "
+              f"link cache {cache.hits - hits} hit(s) / {cache.misses - misses} miss(es)")
+        return stereogram
+
+    def _render_reference(self, depth_map_np, pattern_np, eye_separation_pixels, depth_scale_factor, links_out=None):
+        # Boucle pixel par pixel d'origine, conservée pour comparaison (A/B) avec le moteur vectorisé.
+        h, w, _ = depth_map_np.shape
+        pat_h, pat_w, pat_c = pattern_np.shape
 
         stereogram = np.zeros((h, w, pat_c), dtype=np.float32)
         links = np.full(w, -1, dtype=int) # Stores the source pattern column index for each stereogram column
@@ -146,20 +207,204 @@ class AdvancedAutostereogramNode: # Le nom de la classe est AdvancedAutostereogr
                     
                     stereogram[y, x, :] = pattern_row_tile[actual_col_in_real_pattern, :]
                     links[x] = source_col_in_virtual_pattern
-            
-        output_tensor = torch.from_numpy(stereogram.astype(np.float32)).unsqueeze(0)
-        return (output_tensor,)
+            if links_out is not None:
+                links_out[y] = links
+        return stereogram
+
+    def create_advanced_autostereogram(self, depth_map, pattern, eye_separation_pixels, depth_scale_factor,
+                                       engine="vectorized", workers=1, pattern_phase="none", phase_seed=0,
+                                       incremental=False, link_cache_rows=16384, output_link_map=False):
+        depth_frames = self.preprocess_depth_batch(depth_map)                      # B, H, W, float [0,1]
+        pattern_np = self.preprocess_image_to_numpy(pattern, target_channels=3)     # PatH, PatW, 3, float [0,1]
+        pattern_np = pattern_np.astype(np.float32, copy=False)                      # Préparé une seule fois pour tout le batch
+
+        pat_h, pat_w, pat_c = pattern_np.shape
+
+        if pat_w == 0:
+            raise ValueError("Pattern width cannot be zero.")
+        if eye_separation_pixels <=0:
+            raise ValueError("Eye separation in pixels must be positive.")
+
+        patterns = self._phase_patterns(pattern_np, depth_frames.shape[0], pattern_phase, phase_seed)
+        # Carte des liens : ne dépend que de la profondeur, de eye_separation_pixels et de depth_scale_factor
+        links_out = np.empty(depth_frames.shape, dtype=np.int32) if output_link_map else None
+
+        if engine == "reference":
+            stereogram = np.stack([
+                self._render_reference(frame[..., np.newaxis], frame_pattern, eye_separation_pixels, depth_scale_factor,
+                                       links_out=None if links_out is None else links_out[i])
+                for i, (frame, frame_pattern) in enumerate(zip(depth_frames, patterns))
+            ])
+        elif incremental:
+            stereogram = self._render_incremental(depth_frames, patterns, eye_separation_pixels, depth_scale_factor,
+                                                  link_cache_rows, links_out=links_out)
+        else:
+            stereogram = self._render_vectorized(depth_frames, patterns, eye_separation_pixels, depth_scale_factor,
+                                                 workers, links_out=links_out)
+
+        output_tensor = torch.from_numpy(stereogram) # B, H, W, C
+        link_map = torch.from_numpy(links_out) if links_out is not None else None # B, H, W int32
+        return (output_tensor, link_map)
+
+def parse_sweep_values(text, cast):
+    # "60, 80, 100" (liste) ou "60:140:20" (début:fin:pas, fin incluse), combinables : "30, 60:100:20"
+    values = []
+    for part in str(text).replace(";", ",").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if ":" in part:
+            fields = [f.strip() for f in part.split(":")]
+            if len(fields) not in (2, 3):
+                raise ValueError(f"Invalid range '{part}', expected start:stop or start:stop:step")
+            start, stop = cast(fields[0]), cast(fields[1])
+            step = cast(fields[2]) if len(fields) == 3 else cast(1)
+            if step <= 0:
+                raise ValueError(f"Range step must be positive in '{part}'")
+            count = int(np.floor((stop - start) / step + 1e-9)) + 1
+            values.extend(cast(round(start + i * step, 10)) for i in range(max(0, count)))
+        else:
+            values.append(cast(part))
+    if not values:
+        raise ValueError(f"No values found in '{text}'")
+    return values
+
+class AutostereogramSweepNode(AdvancedAutostereogramNode):
+    # Balayage de paramètres : une image par combinaison (eye_separation_pixels, depth_scale_factor).
+    # Le prétraitement des entrées n'est fait qu'une fois et la carte de profondeur est partagée.
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "depth_map": ("IMAGE",),
+                "pattern": ("IMAGE",),
+                "eye_separation_values": ("STRING", {"default": "80:120:20", "multiline": False, "tooltip": "Comma-separated list and/or start:stop:step ranges (stop included), e.g. '60, 80, 100' or '60:140:20'."}),
+                "depth_scale_values": ("STRING", {"default": "0.3:0.7:0.2", "multiline": False, "tooltip": "Comma-separated list and/or start:stop:step ranges (stop included), e.g. '0.3, 0.5' or '0.3:0.7:0.1'."}),
+            },
+            "optional": {
+                "workers": ("INT", {"default": 1, "min": 0, "max": 256, "step": 1, "tooltip": "Number of threads rendering combinations in parallel. 0 = one per CPU core."}),
+            },
+        }
+
+    RETURN_TYPES = ("IMAGE", "STRING")
+    RETURN_NAMES = ("images", "parameters")
+    FUNCTION = "sweep"
+    CATEGORY = "illusion"
+
+    def sweep(self, depth_map, pattern, eye_separation_values, depth_scale_values, workers=1):
+        eye_separations = parse_sweep_values(eye_separation_values, int)
+        depth_scales = parse_sweep_values(depth_scale_values, float)
+        if min(eye_separations) <= 0:
+            raise ValueError("Eye separation in pixels must be positive.")
+
+        # Prétraitement unique, partagé par toutes les combinaisons (première image du batch)
+        depth_2d = self.preprocess_depth_batch(depth_map)[0]
+        pattern_np = self.preprocess_image_to_numpy(pattern, target_channels=3).astype(np.float32, copy=False)
+        if pattern_np.shape[1] == 0:
+            raise ValueError("Pattern width cannot be zero.")
+
+        combinations = [(p, f) for p in eye_separations for f in depth_scales]
+        print(f"AutostereogramSweepNode: Rendering {len(combinations)} combination(s)")
+        stereograms = render_parameter_sweep(depth_2d, pattern_np, combinations, band_rows=self.BAND_ROWS, workers=workers)
+        labels = "\n".join(f"{i}: eye_separation_pixels={p}, depth_scale_factor={f:g}" for i, (p, f) in enumerate(combinations))
+        return (torch.from_numpy(stereograms), labels)
+
+class AutostereogramRetextureNode(AdvancedAutostereogramNode):
+    # Applique un nouveau motif à une carte de liens sortie par AdvancedAutostereogramNode
+    # (output_link_map). Pas de nouvelle passe de liaison : un seul gather par image.
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "link_map": ("STEREO_LINK_MAP",),
+                "pattern": ("IMAGE",),
+            },
+        }
+
+    RETURN_TYPES = ("IMAGE",)
+    RETURN_NAMES = ("image",)
+    FUNCTION = "retexture"
+    CATEGORY = "illusion"
+
+    def retexture(self, link_map, pattern):
+        if link_map is None:
+            raise ValueError("No link map: enable 'output_link_map' on the Autostereogram Creator node.")
+        pattern_np = self.preprocess_image_to_numpy(pattern, target_channels=3).astype(np.float32, copy=False)
+        if pattern_np.shape[1] == 0:
+            raise ValueError("Pattern width cannot be zero.")
+        links = link_map.cpu().numpy() if isinstance(link_map, torch.Tensor) else np.asarray(link_map)
+        if links.ndim == 2:
+            links = links[np.newaxis]
+        return (torch.from_numpy(apply_link_map(links, pattern_np)),)
+
+class AutostereogramStreamNode(AdvancedAutostereogramNode):
+    # Rendu hors mémoire pour les très grands formats (impression) : la carte de profondeur est lue
+    # par bandes depuis un fichier .npy ou brut mappé en mémoire, et chaque bande est écrite
+    # directement dans le fichier de sortie. La mémoire utilisée dépend de band_rows, pas de l'image.
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "depth_path": ("STRING", {"default": "", "multiline": False, "tooltip": "Depth map file: .npy (H,W) or (H,W,C), or raw H x W file (see raw_* inputs)."}),
+                "pattern": ("IMAGE",),
+                "output_path": ("STRING", {"default": "", "multiline": False}),
+                "output_format": (OUTPUT_FORMATS, {"default": "npy_uint8"}),
+                "eye_separation_pixels": ("INT", {"default": 100, "min": 30, "max": 400, "step": 1}),
+                "depth_scale_factor": ("FLOAT", {"default": 0.5, "min": 0.01, "max": 2.0, "step": 0.01}),
+                "band_rows": ("INT", {"default": 256, "min": 1, "max": 65536, "step": 1, "tooltip": "Rows rendered per band. Peak memory is proportional to band_rows x width (x workers)."}),
+            },
+            "optional": {
+                "raw_width": ("INT", {"default": 0, "min": 0, "max": 1000000, "step": 1}),
+                "raw_height": ("INT", {"default": 0, "min": 0, "max": 1000000, "step": 1}),
+                "raw_dtype": (RAW_DTYPES, {"default": "uint8", "tooltip": "Sample type of a raw depth file. Integer depths are scaled by their type maximum (uint8 / 255, uint16 / 65535); float depths above 1.1 are divided by 255."}),
+                "workers": ("INT", {"default": 1, "min": 0, "max": 256, "step": 1, "tooltip": "Number of bands rendered in parallel. 0 = one per CPU core."}),
+            },
+        }
+
+    RETURN_TYPES = ("STRING",)
+    RETURN_NAMES = ("output_path",)
+    FUNCTION = "create_streamed_autostereogram"
+    OUTPUT_NODE = True
+    CATEGORY = "illusion"
+
+    def create_streamed_autostereogram(self, depth_path, pattern, output_path, output_format, eye_separation_pixels,
+                                       depth_scale_factor, band_rows, raw_width=0, raw_height=0, raw_dtype="uint8", workers=1):
+        if not depth_path or not os.path.isfile(depth_path):
+            raise FileNotFoundError(f"Depth map file not found: '{depth_path}'")
+        if not output_path:
+            raise ValueError("output_path must be set.")
+        if eye_separation_pixels <=0:
+            raise ValueError("Eye separation in pixels must be positive.")
+
+        pattern_np = self.preprocess_image_to_numpy(pattern, target_channels=3).astype(np.float32, copy=False)
+        if pattern_np.shape[1] == 0:
+            raise ValueError("Pattern width cannot be zero.")
+
+        depth_source = open_depth_source(depth_path, raw_width, raw_height, raw_dtype)
+        h, w = depth_source.shape[:2]
+        output = open_stream_output(output_path, h, w, pattern_np.shape[2], output_format)
+        print(f"AutostereogramStreamNode: Rendering {w}x{h} in bands of {band_rows} rows to {output_path}")
+        stream_stereogram(depth_source, pattern_np, eye_separation_pixels, depth_scale_factor, output,
+                          band_rows=band_rows, workers=workers)
+        del output
+        return (output_path,)
 
 # --- Mappings pour ComfyUI ---
 # Assurez-vous que le nom de la classe ici correspond à celui défini ci-dessus.
 NODE_CLASS_MAPPINGS = {
-    "AdvancedAutostereogramNode": AdvancedAutostereogramNode
+    "AdvancedAutostereogramNode": AdvancedAutostereogramNode,
+    "AutostereogramSweepNode": AutostereogramSweepNode,
+    "AutostereogramRetextureNode": AutostereogramRetextureNode,
+    "AutostereogramStreamNode": AutostereogramStreamNode,
     # Si vous voulez que l'ancien workflow fonctionne sans changer le nom du noeud dans le JSON:
     # "AutostereogramNode": AdvancedAutostereogramNode 
 }
 
 NODE_DISPLAY_NAME_MAPPINGS = {
-    "AdvancedAutostereogramNode": "Autostereogram Creator (Advanced)"
+    "AdvancedAutostereogramNode": "Autostereogram Creator (Advanced)",
+    "AutostereogramSweepNode": "Autostereogram Parameter Sweep",
+    "AutostereogramRetextureNode": "Autostereogram Re-texture",
+    "AutostereogramStreamNode": "Autostereogram Creator (Streaming)",
     # Ou pour correspondre à la clé ci-dessus si vous l'avez changée :
     # "AutostereogramNode": "Autostereogram Creator (Adv.)"
 }
\ No newline at end of file
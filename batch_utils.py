@@ -0,0 +1,39 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Utilitaires partagés par les nœuds qui produisent un batch d'images (une image par graine, par phase...).
+
+
+def resolve_batch_seeds(seed, batch_seeds="", batch_count=1):
+    # batch_seeds : liste explicite "1, 5, 42" (prioritaire). Sinon batch_count graines consécutives
+    # à partir de seed. Chaque image ne dépend que de sa propre graine : elle est reproductible seule.
+    seeds = [int(part) for part in str(batch_seeds or "").replace(";", ",").split(",") if part.strip()]
+    if seeds:
+        return seeds
+    return [seed + i for i in range(max(1, int(batch_count)))]
+
+
+def resolve_workers(workers):
+    # 0 (ou négatif, ou None) = un thread par cœur disponible
+    if workers is None or workers <= 0:
+        return os.cpu_count() or 1
+    return int(workers)
+
+
+def map_frames(fn, items, workers=0):
+    # Applique fn à chaque élément et renvoie les résultats dans l'ordre d'entrée.
+    # Les tâches sont calculées sur un pool de threads (NumPy et PIL libèrent le GIL sur leurs boucles).
+    # Seul pool de threads du paquet : nœuds générateurs et moteur de stéréogrammes.
+    items = list(items)
+    workers = min(resolve_workers(workers), len(items))
+    if workers <= 1:
+        return [fn(item) for item in items]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # list() propage les éventuelles exceptions des threads
+        return list(pool.map(fn, items))
+
+
+def loop_phases(phase=0.0, frame_count=1):
+    # Phases d'une boucle d'animation : frame_count images régulièrement réparties sur une période,
+    # à partir de `phase` (dans [0, 1)). L'image qui suivrait la dernière retombe sur la première.
+    return [(phase + i / frame_count) % 1.0 for i in range(max(1, int(frame_count)))]
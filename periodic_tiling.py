@@ -0,0 +1,88 @@
+import numpy as np
+
+# Rendu des motifs périodiques : seule une période (cellule) est calculée, le reste de la toile est
+# rempli par copies de blocs. Le coût de dessin devient O(cellule), plus O(toile) en memcpy.
+
+
+def tile_to(cell, height, width, out=None):
+    # Remplit (height, width, ...) en répétant `cell` depuis l'origine. Copies doublantes :
+    # chaque copie part d'un multiple de la période, O(log n) copies par axe.
+    # Fonctionne aussi sur des tenseurs torch (cell et out), sans passer par NumPy.
+    cell_h, cell_w = cell.shape[:2]
+    if out is None:
+        out = np.empty((height, width) + cell.shape[2:], dtype=cell.dtype)
+    h0, w0 = min(cell_h, height), min(cell_w, width)
+    out[:h0, :w0] = cell[:h0, :w0]
+
+    filled = w0
+    while filled < width:
+        n = min(filled, width - filled)
+        out[:h0, filled:filled + n] = out[:h0, :n]
+        filled += n
+    filled = h0
+    while filled < height:
+        n = min(filled, height - filled)
+        out[filled:filled + n] = out[:n]
+        filled += n
+    return out
+
+
+def render_periodic(height, width, period_y, period_x, render_window, margins=(0, 0, 0, 0), out=None):
+    # render_window(y0, y1, x0, x1) évalue le motif sur une fenêtre, en coordonnées globales.
+    # margins (haut, bas, gauche, droite) : bandes où le motif n'est plus périodique (bords, fin du
+    # motif), recalculées exactement après le pavage. La cellule de référence est prise à un multiple
+    # de la période hors des marges, pour qu'elle soit en phase avec l'origine.
+    top, bottom, left, right = (max(0, min(m, limit)) for m, limit in zip(margins, (height, height, width, width)))
+    period_y, period_x = min(period_y, height), min(period_x, width)
+    cell_y = -(-top // period_y) * period_y
+    cell_x = -(-left // period_x) * period_x
+    if cell_y + period_y > height - bottom or cell_x + period_x > width - right:
+        # Pas de période complète hors des marges : rendu direct
+        if out is None:
+            return render_window(0, height, 0, width)
+        out[...] = render_window(0, height, 0, width)
+        return out
+
+    cell = render_window(cell_y, cell_y + period_y, cell_x, cell_x + period_x)
+    out = tile_to(cell, height, width, out)
+
+    strips = [
+        (0, top, 0, width),
+        (height - bottom, height, 0, width),
+        (top, height - bottom, 0, left),
+        (top, height - bottom, width - right, width),
+    ]
+    for y0, y1, x0, x1 in strips:
+        if y1 > y0 and x1 > x0:
+            out[y0:y1, x0:x1] = render_window(y0, y1, x0, x1)
+    return out
+
+
+def translated_frame(layers, phase, height, width, combine="over"):
+    # Image à la phase `phase` (0-1) d'un motif dont les couches défilent d'une période par boucle.
+    # Chaque couche est rendue une seule fois, à la phase 0, sur une étendue élargie d'une période le
+    # long de son axe ; une image n'en prend qu'une tranche décalée de round(phase * période) pixels.
+    # Couche : dict mask, axis (1 = défilement horizontal), period, reverse (défilement vers les
+    # coordonnées croissantes : l'élargissement est alors avant l'origine), rows (bande (b0, b1) de
+    # l'image couverte, ou None), value (encre déposée). combine : "over" compose les couches dans
+    # l'ordre, "max" garde la plus couvrante. Une couche unique sur toute l'image est rendue sans copie.
+    views = []
+    for layer in layers:
+        shift = int(round(phase * layer["period"]))
+        start = int(round(layer["period"])) - shift if layer["reverse"] else shift
+        index = [slice(None), slice(None)]
+        index[layer["axis"]] = slice(start, start + (width if layer["axis"] == 1 else height))
+        views.append(layer["mask"][tuple(index)])
+
+    if len(layers) == 1 and layers[0]["rows"] is None:
+        return views[0]
+    if combine == "max":
+        out = np.maximum(views[0], views[1])
+        for view in views[2:]:
+            np.maximum(out, view, out=out)
+        return out
+    out = np.zeros((height, width), dtype=np.float32)
+    for layer, view in zip(layers, views):
+        b0, b1 = layer["rows"] if layer["rows"] is not None else (0, height)
+        out[b0:b1] += (layer["value"] - out[b0:b1]) * view
+    return out
@@ -0,0 +1,149 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import torch
+
+# Cache LRU borné en octets, partagé entre exécutions des nœuds (et entre threads d'un même batch).
+# Les tableaux NumPy stockés sont passés en lecture seule. Une valeur qui sort du nœud (tenseur IMAGE)
+# doit être copiée : torch ne sait pas protéger en écriture la mémoire qu'il partage avec le cache.
+
+
+def value_nbytes(value):
+    # Taille d'une valeur en cache : tableaux NumPy / tenseurs, ou tuples et dicts de ceux-ci.
+    if isinstance(value, (tuple, list)):
+        return sum(value_nbytes(item) for item in value)
+    if isinstance(value, dict):
+        return sum(value_nbytes(item) for item in value.values())
+    nbytes = getattr(value, "nbytes", None)
+    if nbytes is None and hasattr(value, "element_size"):
+        nbytes = value.element_size() * value.nelement()
+    return int(nbytes or 0)
+
+
+def freeze(value):
+    # Marque les tableaux NumPy en lecture seule (récursivement dans les tuples / dicts).
+    if isinstance(value, np.ndarray):
+        value.setflags(write=False)
+    elif isinstance(value, (tuple, list)):
+        for item in value:
+            freeze(item)
+    elif isinstance(value, dict):
+        for item in value.values():
+            freeze(item)
+    return value
+
+
+class LRUCache:
+
+    def __init__(self, max_bytes, name="cache"):
+        self.max_bytes = max(0, int(max_bytes))
+        self.name = name
+        self._entries = OrderedDict() # clé -> (valeur, octets)
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        # Une valeur plus grosse que tout le budget n'est pas conservée (elle viderait le cache).
+        nbytes = value_nbytes(value)
+        freeze(value)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= previous[1]
+            if nbytes > self.max_bytes:
+                return value
+            self._entries[key] = (value, nbytes)
+            self.current_bytes += nbytes
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted
+        return value
+
+    def get_or_create(self, key, factory):
+        # Le calcul se fait hors verrou : deux threads peuvent calculer la même clé, le résultat est identique.
+        value = self.get(key)
+        if value is None:
+            value = self.put(key, factory())
+        return value
+
+    def stats(self):
+        return (f"{self.name}: {self.hits} hit(s), {self.misses} miss(es), {len(self._entries)} entrée(s), "
+                f"{self.current_bytes / 2**20:.1f}/{self.max_bytes / 2**20:.0f} Mo")
+
+
+def env_int(name, default):
+    # Entier lu dans l'environnement ; une valeur invalide garde la valeur par défaut (avec avertissement)
+    raw = os.environ.get(name, str(default))
+    try:
+        return int(raw)
+    except ValueError:
+        print(f"[illusion_node] Avertissement: {name}={raw!r} n'est pas un entier, valeur par défaut {default} utilisée.")
+        return default
+
+
+# ILLUSION_NODE_CACHE_DEBUG=1 affiche les compteurs des caches à chaque accès
+CACHE_DEBUG = os.environ.get("ILLUSION_NODE_CACHE_DEBUG", "0").strip() not in ("", "0")
+
+# Masques de couverture des nœuds op-art, indépendants des couleurs
+COVERAGE_CACHE = LRUCache(256 << 20, "coverage masks")
+
+# Champs de coordonnées polaires (rayon, angle) partagés par les nœuds générateurs
+FIELD_CACHE = LRUCache(256 << 20, "coordinate fields")
+
+# Sorties des nœuds générateurs purs, indexées par l'empreinte de leurs paramètres. Budget réglable
+# par la variable d'environnement ILLUSION_NODE_OUTPUT_CACHE_MB (0 désactive le cache).
+OUTPUT_CACHE = LRUCache(env_int("ILLUSION_NODE_OUTPUT_CACHE_MB", 1024) << 20, "node outputs")
+
+
+# Dalles redimensionnées des nœuds à dalles, indexées par contenu, taille cible et filtre. Budget réglable
+# par ILLUSION_NODE_RESIZE_CACHE_MB.
+RESIZE_CACHE = LRUCache(env_int("ILLUSION_NODE_RESIZE_CACHE_MB", 512) << 20, "resized tiles")
+
+
+def tensor_fingerprint(tensor):
+    # Empreinte de contenu d'un tenseur image : forme, type et hachage BLAKE2b de tous ses octets.
+    # Deux tenseurs de même contenu partagent l'entrée, tout pixel modifié en change l'empreinte.
+    # Hacher toute la dalle coûte environ la moitié d'un redimensionnement qu'elle évite, sans risque
+    # de confondre deux images qui ne diffèrent que par quelques pixels.
+    data = np.ascontiguousarray(tensor.detach().cpu().numpy())
+    digest = hashlib.blake2b(memoryview(data).cast("B"), digest_size=16).hexdigest()
+    return digest, tuple(data.shape), str(data.dtype)
+
+
+def params_key(name, params):
+    # Empreinte canonique (SHA-256) d'un nœud et de ses paramètres, indépendante de l'ordre des clés.
+    payload = json.dumps([name, params], sort_keys=True, separators=(",", ":"), default=repr)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def cached_tensor(name, params, render):
+    # render() -> tableau NumPy (B, H, W, C) float32, calculé seulement si l'empreinte est absente du
+    # cache. Le tenseur rendu est une copie : une modification en place en aval ne touche pas le cache.
+    frames = OUTPUT_CACHE.get_or_create(params_key(name, params), render)
+    if CACHE_DEBUG:
+        print(f"{name}: {OUTPUT_CACHE.stats()}")
+    return torch.from_numpy(frames.copy())
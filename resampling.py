@@ -0,0 +1,102 @@
+import math
+
+import numpy as np
+import torch
+
+from .render_cache import CACHE_DEBUG, RESIZE_CACHE, tensor_fingerprint
+
+# Redimensionnement d'images directement en float32, par noyaux séparables (même calcul de coefficients
+# que PIL : support élargi du facteur de réduction pour l'antialiasing, poids normalisés par pixel).
+# Partagé par les nœuds à dalles : pas de conversion uint8 / PIL, pas de quantification en 8 bits, et
+# tout un batch est traité en un appel. Chaque passe est un produit matrice creuse x image.
+
+
+def _bilinear(x):
+    x = np.abs(x)
+    return np.where(x < 1.0, 1.0 - x, 0.0)
+
+
+def _bicubic(x, a=-0.5):
+    x = np.abs(x)
+    near = ((a + 2.0) * x - (a + 3.0)) * x * x + 1.0
+    far = (((x - 5.0) * x + 8.0) * x - 4.0) * a
+    return np.where(x < 1.0, near, np.where(x < 2.0, far, 0.0))
+
+
+def _lanczos(x):
+    return np.where(np.abs(x) < 3.0, np.sinc(x) * np.sinc(x / 3.0), 0.0)
+
+
+# filtre -> (demi-largeur du noyau, noyau)
+FILTERS = {
+    "bilinear": (1.0, _bilinear),
+    "bicubic": (2.0, _bicubic),
+    "lanczos": (3.0, _lanczos),
+}
+
+
+def resample_weights(in_size, out_size, resample="lanczos"):
+    # Matrice creuse (out_size, in_size) d'une passe 1D, comme ImagingResample de PIL.
+    scale = in_size / out_size
+    centers = (np.arange(out_size) + 0.5) * scale
+    if resample == "nearest":
+        cols = np.minimum(np.floor(centers).astype(np.int64), in_size - 1)
+        rows = np.arange(out_size)
+        values = np.ones(out_size)
+    else:
+        half_width, kernel = FILTERS[resample]
+        filter_scale = max(scale, 1.0)
+        support = half_width * filter_scale
+        taps = int(math.ceil(support)) * 2 + 1
+        first = np.maximum((centers - support + 0.5).astype(np.int64), 0)
+        cols = first[:, np.newaxis] + np.arange(taps)
+        weights = kernel((cols - centers[:, np.newaxis] + 0.5) / filter_scale)
+        weights[cols >= np.minimum((centers + support + 0.5).astype(np.int64), in_size)[:, np.newaxis]] = 0.0
+        weights /= weights.sum(axis=1, keepdims=True)
+        keep = weights != 0.0
+        rows = np.broadcast_to(np.arange(out_size)[:, np.newaxis], cols.shape)[keep]
+        cols, values = cols[keep], weights[keep]
+    indices = torch.from_numpy(np.stack([rows, cols]))
+    # Indices construits ici, dans les bornes par construction : pas de vérification des invariants
+    # (l'opt-out explicite évite aussi l'avertissement "implicitly disabled" de torch à chaque processus)
+    return torch.sparse_coo_tensor(indices, torch.from_numpy(values.astype(np.float32)), (out_size, in_size),
+                                   check_invariants=False)
+
+
+def _resample_axis(images, axis, out_size, resample):
+    # Passe 1D sur l'axe `axis` d'un batch (B, H, W, C) : l'axe est amené en tête pour le produit creux
+    if images.shape[axis] == out_size:
+        return images
+    moved = images.movedim(axis, 0)
+    shape = moved.shape
+    weights = resample_weights(shape[0], out_size, resample)
+    out = torch.sparse.mm(weights, moved.reshape(shape[0], -1))
+    return out.reshape((out_size,) + tuple(shape[1:])).movedim(0, axis)
+
+
+def resize_images(images, width, height, resample="lanczos"):
+    # Batch (B, H, W, C) ou image (H, W, C) float -> float32 redimensionné en (…, height, width, C),
+    # borné à [0, 1] comme l'écrêtage 8 bits de PIL. Passe horizontale puis verticale, comme PIL.
+    single = images.ndim == 3
+    images = images.unsqueeze(0) if single else images
+    images = images.detach().cpu().float()
+    if images.shape[1:3] == (height, width):
+        out = images
+    else:
+        out = _resample_axis(images, 2, width, resample)
+        out = _resample_axis(out, 1, height, resample)
+        out = out.clamp_(0.0, 1.0).contiguous()
+    return out[0] if single else out
+
+
+def cached_resize(images, width, height, resample="lanczos"):
+    # resize_images avec cache partagé (LRU borné) indexé par l'empreinte de l'entrée : réexécuter un
+    # nœud avec la même image et la même taille ne refait pas le filtrage. Le tenseur rendu est une
+    # copie, il peut être modifié sans toucher au cache.
+    if tuple(images.shape[-3:-1]) == (height, width):
+        return resize_images(images, width, height, resample)
+    key = ("resize", tensor_fingerprint(images), int(width), int(height), resample)
+    out = RESIZE_CACHE.get_or_create(key, lambda: resize_images(images, width, height, resample))
+    if CACHE_DEBUG:
+        print(RESIZE_CACHE.stats())
+    return out.clone()
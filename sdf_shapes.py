@@ -0,0 +1,351 @@
+import math
+
+import numpy as np
+
+from .batch_utils import map_frames
+from .periodic_tiling import render_periodic
+from .render_cache import COVERAGE_CACHE, FIELD_CACHE
+
+# Moteur de formes par champs de distance (SDF) partagé par OpticalIllusionNode et OpticalGeometricNode.
+# Chaque famille de formes (anneaux, polygones concentriques, rayons, courbes, réseaux) est évaluée sur
+# toute la grille en quelques opérations NumPy, au lieu d'un appel ImageDraw par primitive : le coût
+# dépend du nombre de pixels, pas de `frequency`.
+#
+# Conventions (identiques à ImageDraw) : le pixel (x, y) a son centre en coordonnées entières,
+# y vers le bas. Un trait de largeur w est centré sur sa ligne (line, arc de rayon), les contours
+# (rectangle, ellipse, polygon) sont tracés vers l'intérieur de la forme.
+
+
+def window_bounds(size, window=None):
+    # Fenêtre (y0, y1, x0, x1) de la toile carrée à évaluer ; toute la toile par défaut.
+    return window if window is not None else (0, size, 0, size)
+
+
+def pixel_grid(size, cx, cy, window=None):
+    # Coordonnées (dx, dy) relatives au centre, en float32, diffusables (1, W) et (H, 1).
+    y0, y1, x0, x1 = window_bounds(size, window)
+    xs = np.arange(x0, x1, dtype=np.float32)
+    ys = np.arange(y0, y1, dtype=np.float32)
+    return (xs - np.float32(cx))[np.newaxis, :], (ys - np.float32(cy))[:, np.newaxis]
+
+
+def polar_grid(size, cx, cy, window=None):
+    # (rho, phi) sur la grille, phi dans [0, 2*pi) dans le sens de ImageDraw. Les champs sont partagés
+    # entre nœuds et exécutions par FIELD_CACHE (clé : centre et fenêtre) et sont en lecture seule.
+    # Une toile rectangulaire se passe par sa fenêtre (0, height, 0, width).
+    window = window_bounds(size, window)
+
+    def compute():
+        dx, dy = pixel_grid(size, cx, cy, window)
+        rho = np.sqrt(dx * dx + dy * dy)
+        phi = np.mod(np.arctan2(dy, dx), np.float32(2 * np.pi))
+        return rho, phi
+
+    return FIELD_CACHE.get_or_create(("polar", float(cx), float(cy), tuple(window)), compute)
+
+
+def coverage(distance, half_width, antialias=False):
+    # Couverture d'un trait de demi-largeur half_width à partir de la distance à sa ligne médiane.
+    # Sans antialiasing : pixel allumé si son centre est dans le trait. Avec : couverture analytique
+    # (rampe d'un pixel centrée sur le bord), qui converge vers le même masque une fois seuillée à 0.5.
+    if antialias:
+        return np.clip(np.float32(half_width + 0.5) - distance, 0.0, 1.0).astype(np.float32, copy=False)
+    return (distance <= half_width).astype(np.float32)
+
+
+def centered_stroke(line_width):
+    # Décalage de la ligne médiane et demi-largeur d'un trait centré (convention ImageDraw.line :
+    # une largeur paire déborde d'un pixel du côté des coordonnées croissantes).
+    return 0.5 * ((line_width + 1) % 2), line_width / 2.0
+
+
+def inner_stroke(line_width):
+    # Idem pour un contour tracé vers l'intérieur : la médiane est à (w - 1) / 2 du bord.
+    return (line_width - 1) / 2.0, line_width / 2.0
+
+
+def nearest_level(value, levels):
+    # Indice et distance du niveau le plus proche dans `levels` (croissant) pour chaque pixel.
+    levels = np.asarray(levels, dtype=np.float32)
+    steps = np.diff(levels)
+    if len(levels) > 2 and steps[0] > 0 and np.allclose(steps, steps[0], rtol=1e-4, atol=0):
+        # Niveaux régulièrement espacés : encadrement direct par division, sans recherche dichotomique.
+        # Un écart d'arrondi d'un cran laisse le niveau le plus proche parmi les deux candidats.
+        lower = np.floor((value - levels[0]) * np.float32(1 / steps[0])).astype(np.intp)
+        np.clip(lower, 0, len(levels) - 1, out=lower)
+        upper = np.minimum(lower + 1, len(levels) - 1)
+    else:
+        upper = np.clip(np.searchsorted(levels, value), 0, len(levels) - 1)
+        lower = np.clip(upper - 1, 0, len(levels) - 1)
+    d_upper = np.abs(value - levels[upper])
+    d_lower = np.abs(value - levels[lower])
+    use_lower = d_lower < d_upper
+    return np.where(use_lower, lower, upper), np.where(use_lower, d_lower, d_upper)
+
+
+def phased_levels(levels, phase=0.0, bounds=None):
+    # Niveaux régulièrement espacés `levels` (indice j = parité du contour) décalés de
+    # phase * 2 * espacement : une phase de 1 fait défiler une période complète de l'alternance
+    # pair/impair et redonne l'image de départ. Les niveaux qui sortent de `bounds` (lo, hi),
+    # par défaut l'étendue d'origine, sont retirés ; ceux qui entrent de l'autre côté sont ajoutés.
+    # Retourne (niveaux croissants, indices j correspondants).
+    levels = np.asarray(levels, dtype=np.float64)
+    j = np.arange(len(levels))
+    if phase:
+        spacing = levels[1] - levels[0]
+        lo, hi = bounds if bounds is not None else (levels.min(), levels.max())
+        j = np.arange(-2, len(levels))
+        levels = levels[0] + spacing * (j + 2 * phase)
+        keep = (levels >= lo) & (levels <= hi)
+        levels, j = levels[keep], j[keep]
+    order = np.argsort(levels, kind="stable")
+    return levels[order], j[order]
+
+
+def level_field(value, levels):
+    # Précalcul indépendant de la phase pour phased_level_distance (niveaux régulièrement espacés) :
+    # écart au premier niveau, dans l'unité de `value`, et coordonnée normalisée en espacements.
+    levels = np.asarray(levels, dtype=np.float64)
+    offset = value - np.float32(levels[0])
+    return offset, offset * np.float32(1 / (levels[1] - levels[0]))
+
+
+def phased_level_distance(field, levels, phase=0.0, bounds=None):
+    # nearest_level sur phased_levels(levels, phase, bounds) à partir de level_field : par image, le
+    # niveau le plus proche est l'arrondi de la coordonnée normalisée moins 2 * phase, borné aux
+    # niveaux présents. Égalité -> niveau de plus grande valeur, comme nearest_level.
+    # Retourne (contour pair, distance).
+    offset, normalized = field
+    levels = np.asarray(levels, dtype=np.float64)
+    spacing = levels[1] - levels[0]
+    _, kept = phased_levels(levels, phase, bounds)
+    shift = 2 * phase
+    if spacing > 0:
+        j = np.subtract(normalized, np.float32(shift - 0.5))
+        np.floor(j, out=j)
+    else:
+        j = np.subtract(normalized, np.float32(shift + 0.5))
+        np.ceil(j, out=j)
+    np.clip(j, kept.min(), kept.max(), out=j)
+    # Distance dans l'unité de `value` : exacte pour des niveaux et des coordonnées entiers
+    distance = np.multiply(j, np.float32(spacing))
+    if shift:
+        distance += np.float32(spacing * shift)
+    np.subtract(offset, distance, out=distance)
+    np.abs(distance, out=distance)
+    # Parité sur les entiers (complément à deux : -1 est impair), bien moins cher que np.fmod
+    return (j.astype(np.int32) & 1) == 0, distance
+
+
+def polygon_norm(dx, dy, sides, rotation=0.0):
+    # "Rayon" polygonal : max des projections sur les normales des côtés d'un polygone régulier.
+    # Ses lignes de niveau sont des polygones concentriques, la valeur est l'apothème.
+    norm = None
+    for k in range(sides):
+        angle = rotation + 2 * math.pi * k / sides
+        projection = dx * np.float32(math.cos(angle)) + dy * np.float32(math.sin(angle))
+        norm = projection if norm is None else np.maximum(norm, projection)
+    return norm
+
+
+def concentric_field(norm, edges, line_width):
+    # level_field des contours concentriques dont les bords valent `edges` dans le champ `norm`,
+    # tracés vers l'intérieur : la médiane est à (w - 1) / 2 du bord, |norm - (edge - o)| = |(norm + o) - edge|.
+    offset, half_width = inner_stroke(line_width)
+    return level_field(norm + np.float32(offset), edges), half_width
+
+
+def rays_field(dx, dy, rho, phi, count, length):
+    # Précalcul indépendant de la rotation pour rays_distance : coordonnée angulaire en secteurs et
+    # pixels au-delà de la longueur des rayons (les seuls où l'extrémité du segment compte).
+    outside = np.flatnonzero(rho > np.float32(length))
+    rows, cols = np.divmod(outside, rho.shape[1])
+    return {
+        "dx": dx, "dy": dy, "sectors": phi * np.float32(count / (2 * np.pi)), "count": count, "length": length,
+        "outside": outside, "dx_outside": dx[0, cols], "dy_outside": dy[rows, 0],
+    }
+
+
+def rays_distance(field, rotation=0.0):
+    # Rayons partant du centre aux angles rotation + 2*pi*i/count (0 <= rotation < 2 secteurs), de
+    # longueur `length`. Par image : arrondi de la coordonnée angulaire décalée, direction du rayon
+    # lue dans une table, distance à sa droite (produit vectoriel) ou à son extrémité au-delà de
+    # `length`. Retourne (rayon pair, distance).
+    count, length = field["count"], np.float32(field["length"])
+    sector = 2 * np.pi / count
+    index = np.subtract(field["sectors"], np.float32(rotation / sector))
+    np.rint(index, out=index)
+    # Indices non réduits dans [-2, count] : table décalée de 2, parité inchangée (count est pair)
+    index = index.astype(np.intp)
+    index += 2
+    angle = np.mod(np.arange(-2, count + 1), count) * sector + rotation
+    cos, sin = np.cos(angle).astype(np.float32), np.sin(angle).astype(np.float32)
+    distance = np.multiply(field["dx"], np.take(sin, index))
+    distance -= np.multiply(field["dy"], np.take(cos, index))
+    np.abs(distance, out=distance)
+
+    outside = field["outside"]
+    index_outside = index.ravel()[outside]
+    along = field["dx_outside"] * cos[index_outside] + field["dy_outside"] * sin[index_outside]
+    beyond = along > length
+    outside, along = outside[beyond], along[beyond] - length
+    across = distance.ravel()[outside]
+    distance.ravel()[outside] = np.sqrt(along * along + across * across)
+    return (index & 1) == 0, distance
+
+
+def sine_samples(along, amplitudes, wavenumbers, phase=0.0):
+    # Échantillons de K courbes amplitudes[k] * sin(wavenumbers[k] * along + phase) en une seule passe :
+    # tableaux (K,) + along.shape de la hauteur de courbe et de la norme de son gradient. `along` est
+    # une coordonnée diffusable (1, W) ou (H, 1) : le coût est O(K * W), pas O(K * pixels).
+    amplitudes = np.asarray(amplitudes, dtype=np.float64)
+    wavenumbers = np.asarray(wavenumbers, dtype=np.float64)
+    per_curve = (-1,) + (1,) * np.ndim(along)
+    angle = wavenumbers.astype(np.float32).reshape(per_curve) * along
+    if phase:
+        angle = angle + np.float32(phase)
+    wave = amplitudes.astype(np.float32).reshape(per_curve) * np.sin(angle)
+    slope = (amplitudes * wavenumbers).astype(np.float32).reshape(per_curve) * np.cos(angle)
+    return wave, np.sqrt(1.0 + slope * slope)
+
+
+def sine_band_distance(across, offsets, wave, gradient):
+    # Courbes across = offsets[j] + wave à partir d'échantillons de sine_samples (une courbe).
+    # Distance approchée au premier ordre (écart vertical divisé par la norme du gradient).
+    index, vertical = nearest_level(across - wave, offsets)
+    return index, vertical / gradient
+
+
+def sine_family_distance(along, across, offsets, amplitude, wavenumber, phase=0.0):
+    # Famille de courbes across = offsets[j] + amplitude * sin(wavenumber * along + phase).
+    wave, gradient = sine_samples(along, [amplitude], [wavenumber], phase)
+    return sine_band_distance(across, offsets, wave[0], gradient[0])
+
+
+def spiral_field(rho, phi, turns, max_radius, line_width):
+    # Spirale d'Archimède r = b*theta sur `turns` tours, trait de largeur line_width tracé vers
+    # l'intérieur de r (convention draw.arc). Précalcul indépendant de la rotation pour
+    # spiral_distance : a = (rho + o) / b et la coordonnée de tour (a - phi) / 2pi, dont l'arrondi
+    # est le tour le plus proche.
+    b = max_radius / (2 * math.pi * turns)
+    offset, half_width = inner_stroke(line_width)
+    scaled = (rho + np.float32(offset)) * np.float32(1 / b)
+    return {
+        "scaled": scaled, "turns": (scaled - phi) * np.float32(1 / (2 * np.pi)), "phi": phi, "b": b,
+        "count": turns, "half_width": half_width,
+    }
+
+
+def spiral_distance(field, rotation=0.0):
+    # Spirale de spiral_field tournée de `rotation` (0 <= rotation < 2pi) : phi devient
+    # phi - rotation (mod 2pi), soit rotation / 2pi de plus sur la coordonnée de tour, moins un tour
+    # là où phi < rotation. Distance à la médiane sur le tour le plus proche.
+    if rotation:
+        turns = np.add(field["turns"], np.float32(rotation / (2 * np.pi)))
+        turns -= field["phi"] < np.float32(rotation)
+    else:
+        turns = field["turns"]
+    turn = np.rint(turns)
+    np.clip(turn, 0, field["count"] - 1, out=turn)
+    delta = np.subtract(turns, turn, out=turn)
+    # theta = phi + 2pi * tour = a - 2pi * delta ; écart radial 2pi * b * |delta|
+    theta = np.multiply(delta, np.float32(-2 * np.pi))
+    theta += field["scaled"]
+    # Correction par l'angle entre la spirale et le cercle local
+    correction = np.multiply(theta, theta)
+    correction += 1.0
+    np.sqrt(correction, out=correction)
+    np.divide(theta, correction, out=theta)
+    np.maximum(theta, 0.5, out=theta)
+    radial = np.abs(delta, out=delta)
+    radial *= np.float32(2 * np.pi * field["b"])
+    radial *= theta
+    return radial, field["half_width"]
+
+
+def hex_lattice_distance(size, centers_y, row_shifts, centers_x0, step_x, radius, line_width, window=None):
+    # Réseau d'hexagones (sommets à 0°, 60°, ...) de rayon `radius` : lignes centrées en centers_y,
+    # colonnes en centers_x0 + row_shift + j*step_x. Distance au contour (vers l'intérieur) du plus
+    # proche parmi les 3x3 hexagones candidats autour de chaque pixel.
+    offset, half_width = inner_stroke(line_width)
+    apothem = np.float32(radius * math.cos(math.pi / 6) - offset)
+    centers_y = np.asarray(centers_y, dtype=np.float32)
+    row_shifts = np.asarray(row_shifts, dtype=np.float32)
+    step_y = centers_y[1] - centers_y[0] if len(centers_y) > 1 else np.float32(size)
+    px, py = pixel_grid(size, 0, 0, window)
+
+    best = None
+    base_row = np.rint((py - centers_y[0]) / step_y).astype(np.intp)
+    for dr in (-1, 0, 1):
+        row = np.clip(base_row + dr, 0, len(centers_y) - 1)
+        cy = centers_y[row]
+        shift = row_shifts[row]
+        base_col = np.rint((px - centers_x0 - shift) / np.float32(step_x))
+        for dc in (-1, 0, 1):
+            # Décalage de ligne soustrait en dernier : pour un réseau entier, la position relative
+            # ne dépend pas de la colonne (arrondis identiques d'une cellule à l'autre).
+            local_x = (px - np.float32(centers_x0) - (base_col + dc) * np.float32(step_x)) - shift
+            norm = polygon_norm(local_x, py - cy, 6, math.pi / 6)
+            distance = np.abs(norm - apothem)
+            best = distance if best is None else np.minimum(best, distance)
+    return best, half_width
+
+
+def colorize(ink, rgb1, rgb2, out=None):
+    # Mélange fond/encre : (..., H, W) [0,1] -> (..., H, W, 3) float32 [0,1], écrit dans `out`.
+    # Une passe par canal (vue à pas de 3) puis une division : la diffusion sur un dernier axe de 3
+    # est trois fois plus lente. Un masque binaire donne exactement les couleurs d'origine.
+    rgb1 = np.asarray(rgb1[:3], dtype=np.float32)
+    rgb2 = np.asarray(rgb2[:3], dtype=np.float32)
+    if out is None:
+        out = np.empty(np.shape(ink) + (3,), dtype=np.float32)
+    for c in range(3):
+        channel = out[..., c]
+        np.multiply(ink, rgb2[c] - rgb1[c], out=channel)
+        channel += rgb1[c]
+    out /= np.float32(255.0)
+    return out
+
+
+# Rendu commun des nœuds op-art : chaque nœud fournit ses callbacks de champs indépendants de la phase,
+# de couverture d'une fenêtre et de période ; le pavage, les caches et la boucle d'images sont ici.
+
+
+def render_mask(size, fields, coverage, period=None, field_cache=None):
+    # Masque de couverture (size, size) d'une image : ne dépend que de la géométrie, pas des couleurs.
+    # fields(window) -> champs de la fenêtre, gardés dans field_cache (partagé par les images d'une
+    # animation) ; coverage(window, champs) -> masque de la fenêtre ; period = ((py, px), marges) ou None.
+    # Motif périodique : une seule cellule est dessinée, le reste est pavé par copies.
+    field_cache = {} if field_cache is None else field_cache
+
+    def render_window(*window):
+        if window not in field_cache:
+            field_cache[window] = fields(window)
+        return coverage(window, field_cache[window])
+
+    if period is not None:
+        (period_y, period_x), margins = period
+        return render_periodic(size, size, period_y, period_x, render_window, margins)
+    return render_window(0, size, 0, size)
+
+
+def cached_frame_ink(geometry, phases, render_phase):
+    # Masque de l'image i pour render_frames, gardé en cache (LRU borné) sous la clé geometry + (phase,) :
+    # changer seulement les couleurs ne refait que l'interpolation fond/encre.
+    def frame_ink(i):
+        return COVERAGE_CACHE.get_or_create(geometry + (phases[i],), lambda: render_phase(phases[i]))
+    return frame_ink
+
+
+def render_frames(size, frame_count, frame_ink, rgb1, rgb2):
+    # Lot (frame_count, size, size, 3) float32 : le masque frame_ink(i) de chaque image est colorisé
+    # directement dans la sortie. La première image remplit les caches de champs, les suivantes ne
+    # refont que l'étape dépendant de la phase, en parallèle.
+    frames = np.empty((frame_count, size, size, 3), dtype=np.float32)
+
+    def render_frame(i):
+        colorize(frame_ink(i), rgb1, rgb2, out=frames[i])
+
+    render_frame(0)
+    map_frames(render_frame, range(1, frame_count))
+    return frames
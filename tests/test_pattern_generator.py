@@ -0,0 +1,102 @@
+import hashlib
+import importlib
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+
+# Le dépôt est lui-même le paquet de nœuds (imports relatifs) : on l'importe par le nom de son dossier.
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT.parent))
+pattern_module = importlib.import_module(f"{ROOT.name}.PatternGenerator_node")
+PatternGeneratorNode = pattern_module.PatternGeneratorNode
+
+# Empreintes SHA-256 des images 8 bits, à graine fixée. Stripes, Checkerboard, Gradient et Solid Color
+# sont identiques au tracé pixel par pixel d'origine ; Random Dots et Noise suivent le tirage NumPy par
+# graine. Noise est épinglé en couleur et en niveaux de gris, par pixel et par blocs de 7 (qui ne
+# divisent ni la largeur ni la hauteur : le recadrage des blocs de bord est couvert).
+GOLDEN = {
+    # (pattern_type, width, height, parameter1, parameter2, seed): sha256
+    ("Stripes", 64, 48, 3, 1, 7): "bd5ab035c64160a86b8de9fafdb47fc5fca8f10fa2aafb80d457372b7b076785",
+    ("Stripes", 200, 136, 3, 1, 7): "b179a40b2ac670f3c62a0af19c8aa7a83637cec27a7cfce2dda5800a71c15208",
+    ("Stripes", 64, 48, 16, 1, 7): "eb580c794a44add1067189b84eea745bf7f7af51c0c1ea0eb3df6fcfb3cd2588",
+    ("Stripes", 200, 136, 16, 1, 7): "5a90beae20e0cec89fc10c82be3585ad935305843aba72dbcc5e013108ff4b7f",
+    ("Checkerboard", 64, 48, 5, 1, 7): "0591dbc53585e1dbb342d2a9b0020e6d20cb7d7453f44c663dc4db8f3fd42f3b",
+    ("Checkerboard", 200, 136, 5, 1, 7): "cf496d30b6fd4607504fb91a30a9e4f31a1b3c53997da4ced78a00de856e9ebc",
+    ("Checkerboard", 64, 48, 32, 1, 7): "2b7176e69c98beffd0af3ac085e9911f290ea5841d69418e512770b9f137c1fb",
+    ("Checkerboard", 200, 136, 32, 1, 7): "047e25136caa8e8f085d2050475618895314c53f6651a1ce101f0a46f1c418b8",
+    ("Gradient", 64, 48, 0, 1, 7): "2ce31318222a14c70c9ba2d2111bdfe589de903ca99e59008b453240ab4561b8",
+    ("Gradient", 200, 136, 0, 1, 7): "68e8dbef332f9782f2391d915b153101be7a79ecf37eaa7f76d5ae71d56a8f91",
+    ("Gradient", 64, 48, 1, 1, 7): "d6dbddd42b8e7bb23c9d5a3639bc343bc4860501fff9b78300bb858666ac37a2",
+    ("Gradient", 200, 136, 1, 1, 7): "dffea0113f61da49e4904d76d9eeb7a90e8e89fce4b6eb04b80a8d3236452de6",
+    ("Gradient", 64, 48, 2, 1, 7): "f3dbcc55e66b5225c319129fccc9bca3820a34e8d981debf4883f092b4520988",
+    ("Gradient", 200, 136, 2, 1, 7): "d52b04335776349aa310504c6e1bdc3ba9ca8b392fb5f7f5eacacfee58f5ff4c",
+    ("Gradient", 64, 48, 3, 1, 7): "e02a31ee234e0fda5f9c6bbd6bca65195c3936ccfc77bb804a7ef2c545d6de52",
+    ("Gradient", 200, 136, 3, 1, 7): "79cb55be71265f71e5726840a28676132979ed03404e91dd0e3010c2c6b61eeb",
+    ("Solid Color", 64, 48, 1, 1, 7): "9315ef8e5aafa37d437bf016d61b329888ed7e99a2b754a52091491b10a6b46e",
+    ("Solid Color", 200, 136, 1, 1, 7): "5e2a8ac0c829bb6dda66d29f3d8b6239ac223e5ef3813689e5d9a34998f31c29",
+    ("Random Dots", 64, 48, 20, 3, 7): "3348fa21d8e7bca2d3be4f6c97d1aa4f910add5489938f9cc8ab4a174c8f5183",
+    ("Random Dots", 200, 136, 20, 3, 7): "573a5e429c66b79f5499525184a48352bebc961671624fa0b0209d6893ffb097",
+    ("Random Dots", 64, 48, 60, 6, 7): "4c079cdc3a85c4f9d02c78e501acb67097146d4ad16db260794be812312e7ea2",
+    ("Random Dots", 200, 136, 60, 6, 7): "0f71fed1853d474ba991096759040bdd7d927e5ad010ca9feeba5d4f255daf8b",
+    ("Noise", 64, 48, 0, 1, 7): "21f20f87c2354c51bc9d2ebe97dfb9549df7fcaf32af395604bbdf060a913a15",
+    ("Noise", 64, 48, 0, 7, 7): "36db52c3930fc4311e4e9851bfc422975eed35c6a08a70c5b3142792ab667da6",
+    ("Noise", 200, 136, 0, 1, 7): "930dfcdce6e42f452f70f0c1157edd0548d1c7fc633cf3801be0ca330b2c5f83",
+    ("Noise", 200, 136, 0, 7, 7): "67ab59d000aab30121570a5a5e50fb653b3ca123ebddc18fd51d589bec9a3e40",
+    ("Noise", 64, 48, 1, 1, 7): "121f7d976e9d303a7bcba8f6802ab6740e3dd2389e51e10f183e706e2d771058",
+    ("Noise", 64, 48, 1, 7, 7): "3a88e35a93c110b5b46d18f4b9bcf4a5d0276efebf46bae319ddd644f0c54c6b",
+    ("Noise", 200, 136, 1, 1, 7): "5cb93243c34f04d71f20070120f1a5879a9d67ec9ce43e9f9b583b0eef5e99f9",
+    ("Noise", 200, 136, 1, 7, 7): "845d1cae36259614477fe41faf2b30b01f95ec39ee4d1537cc942bcd21d2a76a",
+}
+
+
+def render(pattern_type, width, height, parameter1, parameter2, seed):
+    (image,) = PatternGeneratorNode().generate_pattern(width, height, pattern_type, "#102030", "#F0E0D0",
+                                                        parameter1, parameter2, seed)
+    return np.rint(image.numpy() * 255.0).astype(np.uint8)
+
+
+def digest(image):
+    return hashlib.sha256(np.ascontiguousarray(image).tobytes()).hexdigest()
+
+
+@pytest.mark.parametrize("params", sorted(GOLDEN))
+def test_golden_images(params):
+    assert digest(render(*params)) == GOLDEN[params]
+
+
+def test_batch_frames_match_single_seeds():
+    (batch,) = PatternGeneratorNode().generate_pattern(64, 48, "Random Dots", "#102030", "#F0E0D0", 30, 4, 5,
+                                                       batch_count=3)
+    for i in range(3):
+        single = render("Random Dots", 64, 48, 30, 4, 5 + i)
+        assert np.array_equal(np.rint(batch[i].numpy() * 255.0).astype(np.uint8), single[0])
+
+
+@pytest.mark.parametrize("grayscale", [0, 1])
+def test_noise_blocks_are_cropped_from_the_block_grid(grayscale):
+    # Blocs de 7 sur 64x48 : chaque bloc est constant, ceux du bord droit et du bas sont tronqués
+    image = render("Noise", 64, 48, grayscale, 7, 11)[0]
+    blocks = image[::7, ::7]
+    expanded = np.repeat(np.repeat(blocks, 7, axis=0), 7, axis=1)[:48, :64]
+    assert np.array_equal(image, expanded)
+    if grayscale:
+        assert np.array_equal(image[..., 0], image[..., 1]) and np.array_equal(image[..., 0], image[..., 2])
+
+
+def test_stamped_dots_match_pil_ellipses():
+    rng = np.random.RandomState(3)
+    width, height = 97, 61
+    dot_x = rng.randint(-5, width + 5, size=400)
+    dot_y = rng.randint(-5, height + 5, size=400)
+    dot_radius = rng.randint(1, 9, size=400)
+
+    reference = Image.new("L", (width, height), 0)
+    draw = ImageDraw.Draw(reference)
+    for x, y, r in zip(dot_x, dot_y, dot_radius):
+        draw.ellipse((x - r, y - r, x + r, y + r), fill=255)
+
+    mask = pattern_module.stamp_dots(height, width, dot_x, dot_y, dot_radius)
+    assert np.array_equal(mask, np.array(reference) > 0)